@@ -0,0 +1,228 @@
+"""
+Load test of every API endpoint against a synthetic SQLite dataset, no
+external services needed. Each scenario sends a number of requests through
+the Flask test client and the report gives, per scenario, the throughput
+and the p50/p95/p99 latency as JSON.
+
+From the backend folder:
+
+    python benchmarks/load.py --size 1k
+    python benchmarks/load.py --size 100k --requests 500 --output report.json
+    python benchmarks/load.py --size 1m --only list_questions,search
+
+Datasets are generated once per size and seed and kept in --data-dir
+(the system temp folder by default).
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+VOCABULARY = (
+    'ancient river empire painting composer planet element mountain island '
+    'battle treaty novel symphony desert ocean volcano kingdom artist theory '
+    'invention language festival dynasty galaxy molecule cathedral harbor '
+    'glacier sculpture poet revolution explorer continent mineral orchestra '
+    'capital frontier legend monument telescope voyage parliament canyon'
+).split()
+INSERT_CHUNK = 10000
+
+
+def misspell(word, rng):
+    position = rng.randrange(1, len(word) - 1)
+    return word[:position] + word[position + 1:]
+
+
+def generate_dataset(path, questions, categories, players, seed):
+    """
+    writes a SQLite database with the app schema and `questions` synthetic
+    questions spread over `categories` categories
+    """
+    from flask import Flask
+    from models import setup_db, db
+
+    rng = random.Random(seed)
+    app = Flask(__name__)
+    #creates the schema
+    setup_db(app, f'sqlite:///{path}')
+    db.get_engine(app).dispose()
+
+    connection = sqlite3.connect(path)
+    connection.executemany('INSERT INTO categories (id, type) VALUES (?, ?)',
+                           [(number, f'Category {number}') for number in range(1, categories + 1)])
+    for start in range(0, questions, INSERT_CHUNK):
+        connection.executemany(
+            'INSERT INTO questions (question, answer, category, difficulty) VALUES (?, ?, ?, ?)',
+            [(
+                ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(6, 12))).capitalize() + '?',
+                rng.choice(VOCABULARY).capitalize(),
+                rng.randint(1, categories),
+                rng.randint(1, 5)
+            ) for _ in range(start, min(start + INSERT_CHUNK, questions))]
+        )
+    connection.executemany('INSERT INTO players (name, score) VALUES (?, ?)',
+                           [(f'player {number}', rng.randint(0, 50)) for number in range(players)])
+    connection.commit()
+    connection.close()
+
+
+def dataset_path(data_dir, questions, categories, players, seed):
+    path = os.path.join(data_dir, f'trivia-bench-{questions}q-{categories}c-{players}p-{seed}.db')
+    if not os.path.exists(path):
+        partial = path + '.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        generate_dataset(partial, questions, categories, players, seed)
+        os.replace(partial, path)
+    return path
+
+
+def scenarios(client, rng, questions, categories, players):
+    """
+    returns {name: (expected statuses, function sending one request)}
+    """
+    deletable_ids = list(range(questions, 0, -1))
+    quiz_session = {}
+
+    def start_quiz_session():
+        category = rng.randint(1, categories)
+        res = client.post('/api/quizzes/sessions', json={'quiz_category': {'id': category}})
+        quiz_session['id'] = res.get_json()['session_id']
+        return res
+
+    def next_quiz_question():
+        if 'id' not in quiz_session:
+            start_quiz_session()
+        res = client.post(f'/api/quizzes/sessions/{quiz_session["id"]}/next')
+        if 'question' not in res.get_json():
+            del quiz_session['id']
+        return res
+
+    def import_batch():
+        rows = [json.dumps({'question': f'Imported {rng.random()}?', 'answer': 'Yes',
+                            'category': rng.randint(1, categories), 'difficulty': 1}) for _ in range(100)]
+        return client.post('/api/questions/import', data='\n'.join(rows), content_type='application/x-ndjson')
+
+    last_page = max((questions - 1) // 10 + 1, 1)
+    return {
+        'list_categories': ((200,), lambda: client.get('/api/categories')),
+        'create_category': ((200,), lambda: client.post('/api/categories', json={'type': f'Bench {rng.random()}'})),
+        'list_questions': ((200,), lambda: client.get(f'/api/questions?page={rng.randint(1, last_page)}')),
+        'list_questions_keyset': ((200,), lambda: client.get(f'/api/questions?after_id={rng.randint(0, questions)}&limit=10')),
+        'list_category_questions': ((200,), lambda: client.get(f'/api/categories/{rng.randint(1, categories)}/questions')),
+        'list_category_questions_keyset': ((200,), lambda: client.get(
+            f'/api/categories/{rng.randint(1, categories)}/questions?after_id={rng.randint(0, questions)}&limit=10')),
+        'search': ((200,), lambda: client.post('/api/questions', json={'searchTerm': rng.choice(VOCABULARY)})),
+        'search_fuzzy': ((200,), lambda: client.post('/api/questions', json={'searchTerm': misspell(rng.choice(VOCABULARY), rng), 'fuzzy': True})),
+        'create_question': ((200,), lambda: client.post('/api/questions', json={
+            'question': f'Benchmark question {rng.random()}?', 'answer': 'Yes',
+            'category': rng.randint(1, categories), 'difficulty': rng.randint(1, 5)})),
+        'delete_question': ((200,), lambda: client.delete(f'/api/questions/{deletable_ids.pop()}')),
+        'quiz': ((200,), lambda: client.post('/api/quizzes', json={
+            'quiz_category': {'id': rng.randint(0, categories)},
+            'previous_questions': [rng.randint(1, questions) for _ in range(rng.randint(0, 10))]})),
+        'quiz_session_start': ((200,), start_quiz_session),
+        'quiz_session_next': ((200,), next_quiz_question),
+        'leaderboard': ((200,), lambda: client.get('/api/leaderboard?page=1')),
+        'player_rank': ((200,), lambda: client.get(f'/api/leaderboard/players/{rng.randint(1, players)}')),
+        'export_category': ((200,), lambda: client.get(f'/api/questions/export?category={rng.randint(1, categories)}&difficulty=1')),
+        'import_batch': ((200,), import_batch),
+    }
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run_scenario(send, expected, requests, warmup):
+    for _ in range(warmup):
+        send().close()
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        res = send()
+        res.get_data()
+        latencies.append(time.perf_counter() - request_started)
+        if res.status_code not in expected:
+            errors += 1
+        res.close()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': requests / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=sorted(SIZES), default='1k', help='number of questions')
+    parser.add_argument('--questions', type=int, default=None, help='overrides --size')
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--players', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per scenario')
+    parser.add_argument('--only', default=None, help='comma separated scenario names')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', default=tempfile.gettempdir())
+    parser.add_argument('--output', default=None, help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    questions = args.questions or SIZES[args.size]
+    source = dataset_path(args.data_dir, questions, args.categories, args.players, args.seed)
+
+    #every run writes, so it works on a copy of the generated dataset
+    working_copy = os.path.join(args.data_dir, f'trivia-bench-run-{os.getpid()}.db')
+    source_connection, copy_connection = sqlite3.connect(source), sqlite3.connect(working_copy)
+    source_connection.backup(copy_connection)
+    source_connection.close()
+    copy_connection.close()
+
+    from flaskr import create_app
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{working_copy}'})
+        client = app.test_client()
+        rng = random.Random(args.seed)
+        available = scenarios(client, rng, questions, args.categories, args.players)
+        selected = args.only.split(',') if args.only else list(available)
+        unknown = set(selected) - set(available)
+        if unknown:
+            parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+        report = {
+            'dataset': {'questions': questions, 'categories': args.categories, 'players': args.players, 'seed': args.seed},
+            'scenarios': {}
+        }
+        for name in selected:
+            expected, send = available[name]
+            report['scenarios'][name] = run_scenario(send, expected, args.requests, args.warmup)
+            print(f'{name}: {report["scenarios"][name]["p50_ms"]:.2f} ms p50', file=sys.stderr)
+    finally:
+        os.remove(working_copy)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
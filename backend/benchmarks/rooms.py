@@ -0,0 +1,150 @@
+"""
+Load test of the live quiz rooms: simulated players subscribe to one room's
+event stream, the host broadcasts questions and part of the players answer
+each one. A few players read their stream slowly and should be dropped once
+their queue is full instead of slowing the room down. The report gives the
+delivery latency of the question events (from the host's request to each
+player reading it), the host and answer request latency, and how many
+players were dropped, as JSON.
+
+From the backend folder:
+
+    python benchmarks/rooms.py --clients 200 --rounds 50
+    python benchmarks/rooms.py --clients 500 --slow-clients 50 --queue-size 16
+
+The questions come from the synthetic dataset of benchmarks/load.py.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load import dataset_path, percentile
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'max_ms': values[-1] * 1000,
+    }
+
+
+def subscribe(app, room_id, slow_delay, rounds, subscribed, received):
+    """
+    reads the room's events like an EventSource would, recording when each
+    question arrived; returns when `rounds` questions were read or the
+    server ended the stream
+    """
+    res = app.test_client().get(f'/api/rooms/{room_id}/events', buffered=False)
+    events = iter(res.response)
+    next(events)
+    subscribed.wait()
+    try:
+        for message in events:
+            if message.startswith(b'event: question\n'):
+                question = json.loads(message.split(b'data: ', 1)[1])
+                received.append((question['id'], time.perf_counter()))
+                if len(received) == rounds:
+                    break
+            if slow_delay:
+                time.sleep(slow_delay)
+    finally:
+        res.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200, help='players subscribed to the room')
+    parser.add_argument('--slow-clients', type=int, default=10, help='players reading their events slowly')
+    parser.add_argument('--slow-delay', type=float, default=0.05, help='seconds a slow player takes per event')
+    parser.add_argument('--rounds', type=int, default=50, help='questions broadcast by the host')
+    parser.add_argument('--answers', type=int, default=20, help='players answering each question')
+    parser.add_argument('--queue-size', type=int, default=64, help='ROOM_QUEUE_SIZE')
+    parser.add_argument('--questions', type=int, default=1000, help='questions of the dataset')
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', default=tempfile.gettempdir())
+    args = parser.parse_args()
+    if args.rounds > args.questions:
+        parser.error('--rounds cannot exceed --questions')
+
+    from flaskr import create_app
+    source = dataset_path(args.data_dir, args.questions, args.categories, 0, args.seed)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{source}', 'ROOM_QUEUE_SIZE': args.queue_size})
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    connection = sqlite3.connect(source)
+    answers = dict(connection.execute('SELECT id, answer FROM questions'))
+    connection.close()
+
+    room = client.post('/api/rooms', json={'quiz_category': {'id': 0}}).get_json()
+    players = [f'player {number}' for number in range(args.clients)]
+    for player_name in players:
+        client.post(f'/api/rooms/{room["room_id"]}/players', json={'player_name': player_name})
+
+    subscribed = threading.Barrier(args.clients + 1)
+    received = [[] for _ in players]
+    threads = [
+        threading.Thread(target=subscribe, daemon=True, args=(
+            app, room['room_id'], args.slow_delay if number < args.slow_clients else 0,
+            args.rounds, subscribed, received[number]))
+        for number in range(args.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    subscribed.wait()
+
+    sent = {}
+    host_latencies, answer_latencies = [], []
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        request_started = time.perf_counter()
+        question = client.post(f'/api/rooms/{room["room_id"]}/next', json={'host_token': room['host_token']}).get_json()['question']
+        host_latencies.append(time.perf_counter() - request_started)
+        sent[question['id']] = request_started
+
+        #right answers, so every one is also broadcast as a score event
+        for player_name in rng.sample(players, min(args.answers, len(players))):
+            request_started = time.perf_counter()
+            client.post(f'/api/rooms/{room["room_id"]}/answers',
+                        json={'player_name': player_name, 'answer': answers[question['id']]})
+            answer_latencies.append(time.perf_counter() - request_started)
+    broadcast_seconds = time.perf_counter() - started
+
+    for thread in threads:
+        thread.join(timeout=args.rounds * args.slow_delay * 4 + 10)
+
+    delivered = [questions for questions in received if len(questions) == args.rounds]
+    report = {
+        'clients': args.clients,
+        'slow_clients': args.slow_clients,
+        'rounds': args.rounds,
+        'queue_size': args.queue_size,
+        'broadcasts_per_second': args.rounds / broadcast_seconds,
+        'complete_clients': len(delivered),
+        'dropped_clients': args.clients - len(delivered),
+        'delivery_latency': summarize([arrived - sent[question_id]
+                                       for questions in received for question_id, arrived in questions]),
+        'host_next_latency': summarize(host_latencies),
+        'answer_latency': summarize(answer_latencies),
+    }
+    print(f'{report["complete_clients"]} of {args.clients} players got every question, '
+          f'{report["delivery_latency"].get("p99_ms", 0):.2f} ms p99 delivery', file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark of the two ways of serializing a list of questions:
+
+    orm         Question.query ... .all(), Question.format() and jsonify
+    projection  column tuples (flaskr.serialization) encoded directly
+
+Runs against an in-memory SQLite database, from the backend folder:
+
+    python benchmarks/serialization.py --questions 10000 --repeat 20
+    python benchmarks/serialization.py --orjson    # ORJSON_RESPONSES on
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from models import setup_db, db, Question, Category
+from flaskr.serialization import question_rows, format_question_row, json_response
+
+
+def seed(questions, categories=6):
+    db.session.execute(Category.__table__.insert(), [{'type': f'Category {number}'} for number in range(categories)])
+    db.session.execute(Question.__table__.insert(), [
+        {
+            'question': f'Question number {number} about something worth knowing?',
+            'answer': f'Answer {number}',
+            'category': number % categories + 1,
+            'difficulty': number % 5 + 1
+        }
+        for number in range(questions)
+    ])
+    db.session.commit()
+
+
+def orm_path():
+    questions = Question.query.order_by(Question.id).all()
+    return jsonify({'success': True, 'questions': [question.format() for question in questions]}).get_data()
+
+
+def projection_path():
+    questions = question_rows(Question.query).order_by(Question.id).all()
+    return json_response({'success': True, 'questions': [format_question_row(question) for question in questions]}).get_data()
+
+
+def measure(path, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        path()
+        timings.append(time.perf_counter() - started)
+        #the ORM path would otherwise reuse objects already in the identity map
+        db.session.remove()
+    timings.sort()
+    return {'best_ms': timings[0] * 1000, 'median_ms': timings[len(timings) // 2] * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--orjson', action='store_true', help='encode the projection path with orjson')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['ORJSON_RESPONSES'] = args.orjson
+    setup_db(app, 'sqlite://')
+    with app.test_request_context():
+        seed(args.questions)
+        if json.loads(orm_path()) != json.loads(projection_path()):
+            sys.exit('the two paths returned different documents')
+
+        results = {
+            'questions': args.questions,
+            'orm': measure(orm_path, args.repeat),
+            'projection': measure(projection_path, args.repeat),
+        }
+        results['speedup'] = results['orm']['median_ms'] / results['projection']['median_ms']
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,122 @@
 
-from hashlib import new
-import json
+import io
 import os
-from flask import Flask, request, abort, jsonify, session
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, request, abort, jsonify, session, stream_with_context
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category, Player
+from models import setup_db, db, database_path, primary_reads, Question, Category, Player
+from .registry import CategoryRegistry, CATEGORY_CACHE_TTL
+from .quiz_sessions import make_quiz_session_store, QUIZ_SESSION_PATH, QUIZ_SESSION_TTL
+from .rooms import RoomStore, ROOM_TTL, ROOM_QUEUE_SIZE, ROOM_KEEPALIVE
+from .search import make_search_backend
+from .bulk import import_questions, import_questions_command, read_rows, IMPORT_BATCH_SIZE
+from .bulk import export_questions, export_questions_command
+from .leaderboard import Leaderboard, LEADERBOARD_CACHE_SIZE
+from .indexes import INDEX_TTL
+from .quiz_index import QuestionIdIndex, draw_options
+from .score_writer import ScoreWriter, SCORE_BATCH_SIZE, SCORE_FLUSH_INTERVAL
+from .http_cache import conditional_get
+from .serialization import question_rows, format_question_row, json_response
+from .metrics import Metrics
+from .routing import ReadRouter, replica_reads
+from .response_cache import ResponseCache, make_cache_backend, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTIONS_PER_PAGE = 100
+MAX_QUIZ_BATCH = 20
+
+
+def questions_by_id(question_ids):
+    """
+    the question_rows() rows of `question_ids`, in that order, read with one
+    query; ids without a row are left out
+    """
+    rows = {row.id: row for row in question_rows(Question.query).filter(Question.id.in_(question_ids))}
+    return [rows[question_id] for question_id in question_ids if question_id in rows]
+
+
+def quiz_question_ids(quiz_category):
+    """
+    the ids of the questions of `quiz_category`, of every question for 0
+    """
+    question_ids = db.session.query(Question.id)
+    if quiz_category != 0:
+        question_ids = question_ids.filter_by(category=quiz_category)
+    return [question_id for question_id, in question_ids]
+
+
+def keyset_page_args():
+    """
+    reads the keyset (cursor) pagination arguments of a listing request.
+    returns None when the request does not opt in with `after_id`
+    """
+    if 'after_id' not in request.args:
+        return None
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
+    if after_id is None or after_id < 0 or limit is None or limit < 1:
+        abort(400)
+    return after_id, min(limit, MAX_QUESTIONS_PER_PAGE)
+
+
+def keyset_page(query, after_id, limit):
+    """
+    seeks past `after_id` on the primary key instead of using OFFSET, so
+    every page costs the same however deep into the listing it is.
+    one extra row is read to tell whether there is a next page
+    """
+    questions = query.filter(Question.id > after_id).order_by(Question.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(questions) > limit:
+        questions = questions[:limit]
+        next_cursor = questions[-1].id
+    return questions, next_cursor
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path),
+             lazy=app.config.get('LAZY_STARTUP', os.environ.get('LAZY_STARTUP') == '1'))
+    Metrics().init_app(app)
+    ReadRouter().init_app(app)
+    category_registry = CategoryRegistry(ttl=app.config.get('CATEGORY_CACHE_TTL', CATEGORY_CACHE_TTL))
+    quiz_sessions = make_quiz_session_store(
+        app.config.get('QUIZ_SESSION_STORE', 'memory'),
+        ttl=app.config.get('QUIZ_SESSION_TTL', QUIZ_SESSION_TTL),
+        path=app.config.get('QUIZ_SESSION_PATH', QUIZ_SESSION_PATH)
+    )
+    rooms = RoomStore(
+        ttl=app.config.get('ROOM_TTL', ROOM_TTL),
+        queue_size=app.config.get('ROOM_QUEUE_SIZE', ROOM_QUEUE_SIZE),
+        keepalive=app.config.get('ROOM_KEEPALIVE', ROOM_KEEPALIVE)
+    )
+    rooms.init_app(app)
+    search_backend = make_search_backend(app.config.get('SEARCH_BACKEND'), app.config['SQLALCHEMY_DATABASE_URI'])
+    question_ids = QuestionIdIndex(ttl=app.config.get('QUESTION_INDEX_TTL', INDEX_TTL))
+    leaderboard = Leaderboard(
+        size=app.config.get('LEADERBOARD_CACHE_SIZE', LEADERBOARD_CACHE_SIZE),
+        ttl=app.config.get('LEADERBOARD_CACHE_TTL', INDEX_TTL)
+    )
+    app.extensions['trivia_indexes'] = {'questions': question_ids, 'players': leaderboard}
+    score_writer = ScoreWriter(
+        app,
+        synchronous=not app.config.get('SCORE_WRITE_BEHIND', False),
+        batch_size=app.config.get('SCORE_BATCH_SIZE', SCORE_BATCH_SIZE),
+        flush_interval=app.config.get('SCORE_FLUSH_INTERVAL', SCORE_FLUSH_INTERVAL)
+    )
+    response_cache = ResponseCache(
+        make_cache_backend(
+            app.config.get('RESPONSE_CACHE', 'memory'),
+            max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', RESPONSE_CACHE_MAX_BYTES),
+            path=app.config.get('RESPONSE_CACHE_PATH', RESPONSE_CACHE_PATH)
+        ),
+        ttl=app.config.get('RESPONSE_CACHE_TTL', RESPONSE_CACHE_TTL)
+    )
+    response_cache.init_app(app)
+    app.cli.add_command(import_questions_command)
+    app.cli.add_command(export_questions_command)
 
     """
     @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -36,6 +138,7 @@ def create_app(test_config=None):
     for all available categories.
     """
     @app.route('/api/categories', methods=['GET', 'POST'])
+    @conditional_get(Category.__tablename__)
     def all_categories():
         if request.method == 'POST':
             try:
@@ -47,9 +150,7 @@ def create_app(test_config=None):
             except:
                 abort(422)
         try:
-            categories = Category.query.all()
-            formatted_categories = {category.format()['id']:category.format()['type'] for category in categories}
-            session['current_category'] = 0
+            formatted_categories = category_registry.categories()
 
             return jsonify({
                 'success': True,
@@ -72,33 +173,56 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions.
     """
     @app.route('/api/questions', methods=['GET'])
+    @conditional_get(Question.__tablename__, Category.__tablename__)
+    @response_cache.cached(Question.__tablename__, Category.__tablename__)
     def all_questions():
+        #optional category scope, 0 for every category
+        current_category = request.args.get('category', 0, type=int)
+        questions_query = question_rows(Question.query)
+        if current_category != 0:
+            questions_query = questions_query.filter_by(category=current_category)
+
+        keyset_args = keyset_page_args()
+        if keyset_args is not None:
+            try:
+                questions, next_cursor = keyset_page(questions_query, *keyset_args)
+                formatted_categories = category_registry.categories()
+            except:
+                abort(422)
+
+            return json_response({
+                'success': True,
+                'questions': [format_question_row(question) for question in questions],
+                'next_cursor': next_cursor,
+                'current_category': current_category,
+                'categories': formatted_categories
+            })
+
         page = request.args.get('page', 1, type=int)
+        if page < 1:
+            abort(404, 'page not found')
         start_index = (page - 1) * QUESTIONS_PER_PAGE
-        end_index = start_index + QUESTIONS_PER_PAGE
 
         try:
-            questions = Question.query.all()
-            formatted_questions = [question.format() for question in questions]
+            #only the requested page is fetched, the total comes from COUNT(*)
+            total_questions = questions_query.count()
+            questions = questions_query.order_by(Question.id).offset(start_index).limit(QUESTIONS_PER_PAGE).all()
+            current_questions = [format_question_row(question) for question in questions]
 
-            categories = Category.query.all()
-            formatted_categories = {category.format()['id']:category.format()['type'] for category in categories}
+            formatted_categories = category_registry.categories()
         except:
             abort(422)
-        #reset current category
-        session['current_category'] = 0
 
-        current_questions = formatted_questions[start_index: end_index]
         if len(current_questions) == 0:
             abort(404, 'page not found')
         
-        return jsonify({
+        return json_response({
             'success': True,
             'questions': current_questions,
-            'total_questions': len(formatted_questions),
-            'current_category': session['current_category'],
+            'total_questions': total_questions,
+            'current_category': current_category,
             'categories': formatted_categories
-        }), 200
+        })
 
 
 
@@ -113,7 +237,6 @@ def create_app(test_config=None):
     @app.route('/api/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
         question = Question.query.get(question_id)
-        print(question)
         if question is None:
             abort(404, description='question not found')
         try:
@@ -145,28 +268,41 @@ def create_app(test_config=None):
     Try using the word "title" to start.
     """
     @app.route('/api/questions', methods=['POST'])
+    @replica_reads
     def search_or_create_question():
         search_term = request.get_json().get('searchTerm', None)
         try:
-            #question search
+            #question search, ranked and paginated
             if search_term:
-                current_category = session.get('current_category', 0)
-                if current_category != 0:
-                    questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).filter_by(category=current_category).all()
+                #explicit scope, or the legacy session scope of older clients
+                if 'category' in request.get_json():
+                    current_category = int(request.get_json()['category'] or 0)
+                else:
+                    current_category = session.get('current_category', 0)
+                if request.get_json().get('fuzzy', False):
+                    #typo tolerant, top matches by trigram similarity
+                    limit = min(max(int(request.get_json().get('limit', QUESTIONS_PER_PAGE)), 1), MAX_QUESTIONS_PER_PAGE)
+                    questions = search_backend.fuzzy_search(search_term, category=current_category, limit=limit)
+                    total_questions = len(questions)
                 else:
-                    questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
+                    page = max(int(request.get_json().get('page', 1)), 1)
+                    questions, total_questions = search_backend.search(search_term, category=current_category, page=page, per_page=QUESTIONS_PER_PAGE)
 
                 formatted_questions = [question.format() for question in questions]
-                print(len(formatted_questions))
                 return jsonify({
                     'success': True,
                     'questions': formatted_questions,
-                    'total_questions': len(formatted_questions),
+                    'total_questions': total_questions,
                     'current_category': current_category
                 }), 200
             else:
             #question creation
                 new_question = Question(**request.get_json())
+                #the form posts category and difficulty as strings
+                new_question.category = int(new_question.category)
+                new_question.difficulty = int(new_question.difficulty)
+                if category_registry.get(new_question.category) is None:
+                    abort(422)
                 new_question.insert()
                 return jsonify({
                     'success': True,
@@ -176,6 +312,46 @@ def create_app(test_config=None):
         except:
             abort(422)
 
+    """
+    Bulk import: streams an NDJSON (default) or CSV body of questions and
+    inserts it in batches, reporting rows and batches that failed.
+    """
+    @app.route('/api/questions/import', methods=['POST'])
+    def bulk_import_questions():
+        format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+        batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
+        if format not in ('ndjson', 'csv') or batch_size is None or batch_size < 1:
+            abort(400)
+
+        try:
+            stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+            report = import_questions(read_rows(stream, format), batch_size=batch_size)
+        except UnicodeDecodeError:
+            abort(400)
+
+        return jsonify({
+            'success': True,
+            **report.format()
+        }), 200
+
+    """
+    Export: streams the question bank as NDJSON, optionally filtered by
+    category and difficulty.
+    """
+    @app.route('/api/questions/export', methods=['GET'])
+    def bulk_export_questions():
+        filters = {}
+        for name in ('category', 'difficulty'):
+            if name in request.args:
+                filters[name] = request.args.get(name, type=int)
+                if filters[name] is None:
+                    abort(400)
+
+        return Response(
+            stream_with_context(export_questions(**filters)),
+            mimetype='application/x-ndjson'
+        )
+
     """
     @TODO:
     Create a GET endpoint to get questions based on category.
@@ -185,22 +361,35 @@ def create_app(test_config=None):
     category to be shown.
     """
     @app.route('/api/categories/<int:category_id>/questions', methods=['GET'])
+    @conditional_get(Question.__tablename__, Category.__tablename__)
+    @response_cache.cached(Question.__tablename__, Category.__tablename__)
     def category_questions(category_id):
-        category = Category.query.get(category_id)
+        category_type = category_registry.get(category_id)
 
-        if category is None:
+        if category_type is None:
             abort(404, description='category not found')
         
+        keyset_args = keyset_page_args()
         try:
-            questions = Question.query.filter_by(category=category_id).all()
-            formatted_questions = [question.format() for question in questions]
-            session['current_category'] = category_id
+            category_query = question_rows(Question.query.filter_by(category=category_id))
+            if keyset_args is not None:
+                questions, next_cursor = keyset_page(category_query, *keyset_args)
 
-            return jsonify({
+                return json_response({
+                    'success': True,
+                    'questions': [format_question_row(question) for question in questions],
+                    'next_cursor': next_cursor,
+                    'current_category': category_type
+                })
+
+            questions = category_query.order_by(Question.id).all()
+            formatted_questions = [format_question_row(question) for question in questions]
+
+            return json_response({
                 'success': True,
                 'questions': formatted_questions,
                 'total_questions': len(formatted_questions),
-                'current_category': category.type
+                'current_category': category_type
             })
         except:
             abort(422)
@@ -218,64 +407,308 @@ def create_app(test_config=None):
     """
 
     @app.route('/api/quizzes', methods=['POST'])
+    @replica_reads
     def quiz():
-        question = {}
+        count = None
         quiz_category = 0
         previous_questions_id = ''
         player_name = ''
         final_score = 0
 
         try:
-            quiz_category = request.get_json().get('quiz_category', 0).get('id', 0)
+            quiz_category = int(request.get_json().get('quiz_category', 0).get('id', 0))
             previous_questions_id = request.get_json().get('previous_questions', [])
             player_name = request.get_json().get('player_name', None)
             final_score = request.get_json().get('final_score', None)
+            count = request.get_json().get('count', None)
         except:
             abort(400)
 
         if type(previous_questions_id) != list:
             abort(422)
+        if count is not None and (type(count) != int or count < 1):
+            abort(422)
+        if final_score is not None and type(final_score) != int:
+            abort(422)
+        if player_name is not None and not isinstance(player_name, str):
+            abort(422)
 
-        category_questions = []
+        try:
+            options = draw_options(request.get_json())
+        except:
+            abort(422)
 
-        if quiz_category == 0:
-            category_questions = Question.query.all() #handles 'all' category request
+        #random unseen ids from the in-memory index, then those rows by primary key
+        for attempt in range(2):
+            picked = question_ids.sample(quiz_category, previous_questions_id, min(count or 1, MAX_QUIZ_BATCH), **options)
+            if picked is None:
+                abort(404, description='no questions or category does not exist')
+            if not picked:
+                next_questions = []
+                break
+            next_questions = questions_by_id(picked)
+            if len(next_questions) < len(picked):
+                #a lagging replica may not have them yet
+                with primary_reads():
+                    next_questions = questions_by_id(picked)
+            if len(next_questions) == len(picked):
+                break
+            #deleted outside this worker
+            question_ids.invalidate()
         else:
-            category_questions = Question.query.filter_by(category=quiz_category).all() #handles specific category request
+            #missing rows are never the end of the quiz
+            if not next_questions:
+                abort(503)
+
+        if next_questions:
+            if count is None:
+                return jsonify({
+                    'success': True,
+                    'question': format_question_row(next_questions[0])
+                }), 200
+            return jsonify({
+                'success': True,
+                'questions': [format_question_row(row) for row in next_questions]
+            }), 200
+        else:
+            #for end of quiz
+            if player_name is not None and final_score is not None:
+                score_writer.record(player_name, final_score)
+            return jsonify({
+                'success': True,
+            }), 200
 
-        if not category_questions:
-            abort(404, description='no questions or category does not exist') 
 
-        category_questions_id = [question.id for question in category_questions]
+    """
+    Quiz sessions: the question deck is shuffled once on the server when the
+    quiz starts, the client then only sends the session id back for every
+    question instead of the growing previous_questions list.
+    """
+    @app.route('/api/quizzes/sessions', methods=['POST'])
+    @replica_reads
+    def start_quiz_session():
+        try:
+            quiz_category = int(request.get_json().get('quiz_category', {}).get('id', 0))
+        except:
+            abort(400)
 
-        #make random question id
-        next_question_id = random.choice(category_questions_id)
-        if len(previous_questions_id) < len(category_questions):
-            while next_question_id in previous_questions_id:
-                next_question_id = random.choice(category_questions_id)
-        else:
-            next_question_id = None
+        deck = quiz_question_ids(quiz_category)
+        if not deck:
+            abort(404, description='no questions or category does not exist')
 
-        #get question with matching id
-        if next_question_id is not None:
-            for q in category_questions: #avoids another interaction with db
-                if q.id == next_question_id:
-                    question = q.format()
+        return jsonify({
+            'success': True,
+            'session_id': quiz_sessions.start(deck),
+            'total_questions': len(deck)
+        }), 200
+
+
+    @app.route('/api/quizzes/sessions/<session_id>/next', methods=['POST'])
+    @replica_reads
+    def next_quiz_question(session_id):
+        body = request.get_json(silent=True) or {}
+        player_name = body.get('player_name', None)
+        final_score = body.get('final_score', None)
+        if final_score is not None and type(final_score) != int:
+            abort(422)
+        if player_name is not None and not isinstance(player_name, str):
+            abort(422)
+
+        try:
+            #questions deleted since the quiz started are skipped
+            question = None
+            while question is None:
+                question_id = quiz_sessions.draw(session_id)
+                if question_id is None:
                     break
+                question = Question.query.get(question_id)
+        except KeyError:
+            abort(404, description='quiz session not found')
 
+        if question is not None:
             return jsonify({
                 'success': True,
-                'question': question
+                'question': question.format()
             }), 200
-        else:
+
+        #for end of quiz
+        quiz_sessions.end(session_id)
+        if player_name is not None and final_score is not None:
+            score_writer.record(player_name, final_score)
+        return jsonify({
+            'success': True,
+        }), 200
+
+
+
+    """
+    Quiz rooms: a host plays a quiz live with many players. The questions
+    and score changes are pushed to every participant as Server-Sent Events
+    instead of being polled.
+    """
+    def find_room(room_id):
+        try:
+            return rooms.get(room_id)
+        except KeyError:
+            abort(404, description='quiz room not found')
+
+
+    @app.route('/api/rooms', methods=['POST'])
+    @replica_reads
+    def create_room():
+        try:
+            quiz_category = int((request.get_json(silent=True) or {}).get('quiz_category', {}).get('id', 0))
+        except:
+            abort(400)
+
+        deck = quiz_question_ids(quiz_category)
+        if not deck:
+            abort(404, description='no questions or category does not exist')
+
+        room_id, room = rooms.create(deck)
+        return jsonify({
+            'success': True,
+            'room_id': room_id,
+            'host_token': room.host_token,
+            'total_questions': room.total_questions
+        }), 200
+
+
+    @app.route('/api/rooms/<room_id>/events', methods=['GET'])
+    def room_events(room_id):
+        room = find_room(room_id)
+        response = Response(rooms.stream(room), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+    @app.route('/api/rooms/<room_id>/players', methods=['POST'])
+    def join_room(room_id):
+        room = find_room(room_id)
+        player_name = (request.get_json(silent=True) or {}).get('player_name')
+        if not isinstance(player_name, str) or not player_name.strip():
+            abort(422)
+
+        with room.lock:
+            if player_name not in room.scores:
+                room.scores[player_name] = 0
+                rooms.publish(room, 'score', {'player_name': player_name, 'score': 0})
+        return jsonify({
+            'success': True,
+            'player_name': player_name
+        }), 200
+
+
+    @app.route('/api/rooms/<room_id>/next', methods=['POST'])
+    @replica_reads
+    def next_room_question(room_id):
+        room = find_room(room_id)
+        if (request.get_json(silent=True) or {}).get('host_token') != room.host_token:
+            abort(403)
+
+        with room.lock:
+            #another request already ended the room and saved its scores
+            if room.closed:
+                return jsonify({
+                    'success': True,
+                }), 200
+            #questions deleted since the room was created are skipped
+            question = None
+            while question is None and room.deck:
+                question = question_rows(Question.query).filter(Question.id == room.deck.pop()).first()
+
+            if question is not None:
+                payload = format_question_row(question)
+                room.answer = payload.pop('answer')
+                room.question = payload
+                room.answered = set()
+                rooms.publish(room, 'question', dict(payload, remaining_questions=len(room.deck)))
+                return jsonify({
+                    'success': True,
+                    'question': payload
+                }), 200
+
             #for end of quiz
-            if player_name is not None and final_score is not None:
-                player = Player(name=player_name, score=final_score)
-                player.insert()
+            room.closed = True
+            room.question = None
+            final_scores = dict(room.scores)
+            rooms.publish(room, 'end', {'scores': final_scores})
+        rooms.end(room_id, room)
+        score_writer.record_many(final_scores.items())
+        return jsonify({
+            'success': True,
+        }), 200
+
+
+    @app.route('/api/rooms/<room_id>/answers', methods=['POST'])
+    def answer_room_question(room_id):
+        room = find_room(room_id)
+        body = request.get_json(silent=True) or {}
+        player_name, answer = body.get('player_name'), body.get('answer')
+        if not isinstance(player_name, str) or not isinstance(answer, str):
+            abort(422)
+
+        with room.lock:
+            if player_name not in room.scores:
+                abort(404, description='player not found in room')
+            if room.question is None or player_name in room.answered:
+                abort(422)
+            room.answered.add(player_name)
+            correct = room.answer is not None and answer.strip().lower() == room.answer.strip().lower()
+            if correct:
+                room.scores[player_name] += 1
+                rooms.publish(room, 'score', {'player_name': player_name, 'score': room.scores[player_name]})
+        return jsonify({
+            'success': True,
+            'correct': correct
+        }), 200
+
+
+
+    """
+    Leaderboard: players ordered by score, best first, and the rank of a
+    single player.
+    """
+    @app.route('/api/leaderboard', methods=['GET'])
+    def top_players():
+        page = request.args.get('page', 1, type=int)
+        limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
+        if page is None or page < 1 or limit is None or limit < 1:
+            abort(400)
+        limit = min(limit, MAX_QUESTIONS_PER_PAGE)
+
+        try:
+            total_players = leaderboard.total()
+            players = leaderboard.page((page - 1) * limit, limit)
+        except:
+            abort(422)
+
+        if not players and page > 1:
+            abort(404, 'page not found')
+
+        return jsonify({
+            'success': True,
+            'players': players,
+            'total_players': total_players
+        }), 200
+
+
+    @app.route('/api/leaderboard/players/<int:player_id>', methods=['GET'])
+    def player_rank(player_id):
+        player = Player.query.get(player_id)
+        if player is None or player.score is None:
+            abort(404, description='player not found')
+
+        try:
             return jsonify({
                 'success': True,
+                'player': player.format(),
+                'rank': leaderboard.rank(player.score),
+                'total_players': leaderboard.total()
             }), 200
-            
+        except:
+            abort(422)
 
 
     """
@@ -295,6 +728,17 @@ def create_app(test_config=None):
             ), 404
         
 
+    @app.errorhandler(403)
+    def forbidden(error):
+        return jsonify(
+                {
+                    "success": False,
+                    "error": 403,
+                    "message": "forbidden"
+                }
+            ), 403
+
+
     @app.errorhandler(405)
     def not_allowed(error):
         return jsonify(
@@ -328,6 +772,17 @@ def create_app(test_config=None):
             ), 400
 
 
+    @app.errorhandler(503)
+    def unavailable(error):
+        return jsonify(
+                {
+                    "success": False,
+                    "error": 503,
+                    "message": "service unavailable"
+                }
+            ), 503
+
+
     @app.errorhandler(500)
     def not_allowed(error):
         return jsonify(
@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, Question, Category, bump_data_version
+from .serialization import question_rows, format_question_row
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+QUESTION_COLUMNS = ('question', 'answer', 'category', 'difficulty')
+
+
+class ImportReport:
+    """
+    ImportReport
+        running totals of a bulk import. every error is counted, only the
+        first MAX_REPORTED_ERRORS are kept for the response
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors = []
+        self.error_count = 0
+
+    def error(self, **details):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(details)
+
+    def format(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'batches': self.batches,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors)
+        }
+
+
+def read_rows(stream, format):
+    """
+    yields (line number, row) from an NDJSON or CSV text stream without
+    reading it all in memory. rows that cannot be parsed are yielded as
+    the parse error instead
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        try:
+            reader.fieldnames
+        except csv.Error as error:
+            yield 1, error
+            return
+        while True:
+            #the reader does not count the line it failed on
+            first_line = reader.line_num + 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as error:
+                #e.g. a field over csv.field_size_limit(); the reader carries on past it
+                yield first_line, error
+                continue
+            yield reader.line_num, row
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as error:
+            yield line_number, error
+
+
+def validate_row(row, category_ids):
+    """
+    returns the Question column values of `row` or raises ValueError.
+    an `id` is ignored, the database assigns new ones
+    """
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+    unknown = set(row) - set(QUESTION_COLUMNS) - {'id'}
+    if unknown:
+        raise ValueError(f'unknown columns: {", ".join(sorted(map(str, unknown)))}')
+
+    values = {}
+    for column in ('question', 'answer'):
+        value = row.get(column)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'{column} is required')
+        values[column] = value
+    for column in ('category', 'difficulty'):
+        value = row.get(column)
+        try:
+            #int() would take true as 1 and truncate 2.9 to 2
+            if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+                raise ValueError(value)
+            values[column] = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{column} must be an integer')
+    if values['category'] not in category_ids:
+        raise ValueError(f'category {values["category"]} does not exist')
+    if values['difficulty'] < 1:
+        raise ValueError('difficulty must be positive')
+    return values
+
+
+def copy_rows(values):
+    """
+    loads a batch with Postgres COPY, one statement for the whole batch
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in values:
+        writer.writerow([row[column] for column in QUESTION_COLUMNS])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {Question.__tablename__} ({", ".join(QUESTION_COLUMNS)}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(values):
+    db.session.execute(Question.__table__.insert(), values)
+
+
+def import_questions(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    validates and inserts (line number, row) pairs `batch_size` rows per
+    transaction. invalid rows and failed batches are reported and skipped,
+    the rest of the load carries on
+    """
+    report = ImportReport()
+    category_ids = {category_id for category_id, in db.session.query(Category.id)}
+    write_batch = copy_rows if db.engine.dialect.name == 'postgresql' else insert_rows
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        report.batches += 1
+
+        values = []
+        for line_number, row in batch:
+            try:
+                if isinstance(row, Exception):
+                    raise ValueError(f'invalid row: {row}')
+                values.append(validate_row(row, category_ids))
+            except ValueError as error:
+                report.failed += 1
+                report.error(line=line_number, message=str(error))
+        if not values:
+            continue
+
+        try:
+            write_batch(values)
+            db.session.commit()
+            report.inserted += len(values)
+        except Exception as error:
+            db.session.rollback()
+            report.failed += len(values)
+            report.error(batch=report.batches, lines=[batch[0][0], batch[-1][0]], message=str(error).split('\n', 1)[0])
+            continue
+        #rows did not go through Question.insert, in-process indexes rebuild on next use
+        bump_data_version(Question.__tablename__)
+
+    return report
+
+
+@click.command('import-questions')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(['ndjson', 'csv']), default=None,
+              help='input format, guessed from the file extension by default')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True, help='rows per transaction')
+@with_appcontext
+def import_questions_command(file, format, batch_size):
+    """Bulk load questions from an NDJSON or CSV file ('-' for stdin)."""
+    if format is None:
+        format = 'csv' if file.name.endswith('.csv') else 'ndjson'
+    report = import_questions(read_rows(file, format), batch_size=batch_size)
+    click.echo(json.dumps(report.format(), indent=2))
+
+
+def export_questions(category=None, difficulty=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    yields the questions as NDJSON lines, in id order. rows are read as
+    plain tuples `chunk_size` at a time through a server-side cursor
+    (yield_per), so memory stays flat whatever the size of the table
+    """
+    query = question_rows(db.session.query(Question))
+    if category is not None:
+        query = query.filter(Question.category == category)
+    if difficulty is not None:
+        query = query.filter(Question.difficulty == difficulty)
+
+    for row in query.order_by(Question.id).yield_per(chunk_size):
+        yield json.dumps(format_question_row(row)) + '\n'
+
+
+@click.command('export-questions')
+@click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--category', type=int, default=None, help='only export this category')
+@click.option('--difficulty', type=int, default=None, help='only export this difficulty')
+@with_appcontext
+def export_questions_command(output, category, difficulty):
+    """Write the questions as NDJSON to a file (stdout by default)."""
+    for line in export_questions(category=category, difficulty=difficulty):
+        output.write(line)
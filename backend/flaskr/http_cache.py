@@ -0,0 +1,82 @@
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+
+from models import data_version, data_last_changed
+
+HTTP_VALIDATOR_TTL = 60
+HTTP_CACHE_MAX_AGE = 5
+
+_process_epoch = {}
+
+
+def process_epoch():
+    """
+    data versions are counted per process, so validators from two workers
+    (or from before a restart) must never compare equal
+    """
+    pid = os.getpid()
+    if pid not in _process_epoch:
+        _process_epoch[pid] = f'{pid}-{os.urandom(8).hex()}'
+    return _process_epoch[pid]
+
+
+def validators(tables):
+    """
+    returns (etag, last modified) for data read from `tables`. both also
+    move every HTTP_VALIDATOR_TTL seconds, so writes made by other workers
+    or outside the app are picked up within that window
+    """
+    ttl = max(current_app.config.get('HTTP_VALIDATOR_TTL', HTTP_VALIDATOR_TTL), 1)
+    now = time.time()
+    window = int(now // ttl)
+    versions = ','.join(f'{table}:{data_version(table)}' for table in tables)
+    etag = hashlib.sha1(f'{process_epoch()}|{window}|{versions}'.encode()).hexdigest()
+    last_modified = max([window * ttl] + [data_last_changed(table) for table in tables])
+    return etag, datetime.fromtimestamp(int(min(last_modified, now)), timezone.utc)
+
+
+def not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return request.if_modified_since is not None and last_modified <= request.if_modified_since
+
+
+def set_cache_headers(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', HTTP_CACHE_MAX_AGE)
+    return response
+
+
+def conditional_get(*tables):
+    """
+    conditional_get(*tables)
+        answers GET requests whose If-None-Match / If-Modified-Since match
+        the current data version of `tables` with 304 Not Modified, without
+        calling the view. successful responses get ETag, Last-Modified and
+        Cache-Control headers, unless the view read from a read replica:
+        the replica may lag behind the data version the validators name
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            etag, last_modified = validators(tables)
+            if not_modified(etag, last_modified):
+                return set_cache_headers(make_response('', 304), etag, last_modified)
+
+            g.pop('db_replica_read', None)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not g.pop('db_replica_read', False):
+                set_cache_headers(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,191 @@
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Question, add_change_listener, data_version, primary_reads
+
+INDEX_TTL = 60
+
+
+class StaleIndex(Exception):
+    """
+    raised by TableIndex.apply when a change cannot be applied in place and
+    the index has to be rebuilt on next use
+    """
+
+
+def signed_rows(rows, signature):
+    """
+    yields `rows`, counting them and keeping the highest id in `signature`,
+    so a build gets the table's signature without another query
+    """
+    for record in rows:
+        signature[0] += 1
+        if signature[1] is None or record['id'] > signature[1]:
+            signature[1] = record['id']
+        yield record
+
+
+def moved_signature(signature, action, record):
+    """
+    the signature once this worker's own change is applied, so the
+    background check does not take it for a write made elsewhere
+    """
+    count, highest = signature
+    if action == 'insert':
+        return count + 1, record['id'] if highest is None else max(highest, record['id'])
+    if action == 'delete':
+        return count - 1, highest
+    return signature
+
+
+class TableIndex:
+    """
+    TableIndex
+        base for in-process structures derived from a table. the index is
+        built on first use and then kept current from the model change
+        notifications; if a change was missed (the data version moved by more
+        than one step, e.g. a concurrent write) it is rebuilt on the next use
+        instead. a rebuild reads and builds the new index outside the lock and
+        swaps it in, so lookups and change notifications are not held up.
+
+        the notifications only cover this worker. with a `ttl`, a background
+        thread compares a cheap signature of the table (row count and highest
+        id) every `ttl` seconds and calls refresh() when it moved, so writes
+        made by other workers or directly in the database converge within
+        that window; without one the index only follows this worker's writes.
+
+        subclasses set `model` and `table` and implement rows(), build(rows)
+        and apply(action, record), rows and records being format() style
+        dicts. build returns the attributes of the new index, set under the
+        lock. apply raises StaleIndex (or fails) to have the index rebuilt
+    """
+
+    model = None
+    table = None
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._version = None
+        self._signature = None
+        self._checked_at = None
+        self._refresh_thread = None
+        add_change_listener(self._on_change)
+
+    def rows(self):
+        raise NotImplementedError
+
+    def build(self, rows):
+        raise NotImplementedError
+
+    def signature(self):
+        """
+        (row count, highest id) of the rows() of the table
+        """
+        return tuple(db.session.query(func.count(self.model.id), func.max(self.model.id)).one())
+
+    def signed(self, record):
+        """
+        whether the record is one of the rows() the signature counts
+        """
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def apply(self, action, record):
+        raise NotImplementedError
+
+    def _swap(self, attributes, version, signature):
+        with self._lock:
+            for name, value in attributes.items():
+                setattr(self, name, value)
+            self._version = version
+            self._signature = signature
+            self._checked_at = time.monotonic()
+
+    def rebuild(self):
+        """
+        builds the index from the primary and swaps it in. the data version
+        is read first: a change made during the build leaves the index a
+        version behind, so it is built again on next use
+        """
+        version = data_version(self.table)
+        signature = [0, None]
+        #a lagging replica would leave the index stale until the next change
+        with primary_reads():
+            attributes = self.build(signed_rows(self.rows(), signature))
+        self._swap(attributes, version, tuple(signature))
+
+    def refresh(self, signature):
+        """
+        called from the background check when the table's signature moved;
+        subclasses that can catch up incrementally override it
+        """
+        self.rebuild()
+
+    def ensure_current(self):
+        if self._version != data_version(self.table):
+            with self._build_lock:
+                if self._version != data_version(self.table):
+                    self.rebuild()
+        elif self.ttl is not None and time.monotonic() - self._checked_at >= self.ttl:
+            self._start_check()
+
+    def _start_check(self):
+        if not self._build_lock.acquire(blocking=False):
+            return
+        self._checked_at = time.monotonic()
+        self._refresh_thread = threading.Thread(
+            target=self._check, args=(current_app._get_current_object(),), name=f'{self.table}-index', daemon=True)
+        self._refresh_thread.start()
+
+    def _check(self, app):
+        try:
+            with app.app_context():
+                signature = self.signature()
+                if signature != self._signature:
+                    self.refresh(signature)
+        except Exception:
+            app.logger.exception('could not refresh the %s index', self.table)
+        finally:
+            self._build_lock.release()
+
+    def _on_change(self, table, action, record):
+        if table != self.table:
+            return
+        with self._lock:
+            if self._version is None:
+                return
+            if self._version + 1 != data_version(table):
+                self._version = None
+                return
+            try:
+                self.apply(action, record)
+                self._version = data_version(table)
+                if self._signature is not None and self.signed(record):
+                    self._signature = moved_signature(self._signature, action, record)
+            except Exception:
+                self._version = None
+
+
+class QuestionIndex(TableIndex):
+    """
+    QuestionIndex
+        TableIndex over the questions table
+    """
+
+    model = Question
+    table = Question.__tablename__
+
+    def rows(self):
+        return (
+            {'id': id, 'question': question, 'answer': answer, 'category': category, 'difficulty': difficulty}
+            for id, question, answer, category, difficulty in Question.query.with_entities(
+                Question.id, Question.question, Question.answer, Question.category, Question.difficulty)
+        )
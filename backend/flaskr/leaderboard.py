@@ -0,0 +1,123 @@
+from bisect import bisect_left, bisect_right, insort
+
+from sqlalchemy import func
+
+from models import db, Player
+from .indexes import TableIndex, StaleIndex, INDEX_TTL
+
+LEADERBOARD_CACHE_SIZE = 100
+
+
+def leaderboard_key(record):
+    return (-record['score'], record['id'])
+
+
+class Leaderboard(TableIndex):
+    """
+    Leaderboard
+        keeps the best `size` players (score descending, oldest first on
+        ties) and the sorted scores of every player in memory. the top pages
+        are served without touching the database and a rank is a binary
+        search over the scores. both are updated on Player.insert/delete;
+        pages past the cached top are read through ix_players_score.
+
+        scores saved by other workers are new rows: every `ttl` seconds the
+        background check reads the players past the highest id read so far
+        and adds them, instead of reloading the table. it is only reloaded
+        when the players do not add up (rows deleted elsewhere)
+    """
+
+    model = Player
+    table = Player.__tablename__
+
+    def __init__(self, size=LEADERBOARD_CACHE_SIZE, ttl=INDEX_TTL):
+        super().__init__(ttl)
+        self.size = size
+
+    def ranked_query(self):
+        return db.session.query(Player.id, Player.name, Player.score) \
+            .filter(Player.score.isnot(None)) \
+            .order_by(Player.score.desc(), Player.id)
+
+    def signature(self):
+        return tuple(db.session.query(func.count(Player.id), func.max(Player.id)).filter(Player.score.isnot(None)).one())
+
+    def signed(self, record):
+        return record['score'] is not None
+
+    def rows(self):
+        return ({'id': id, 'name': name, 'score': score} for id, name, score in self.ranked_query())
+
+    def build(self, rows):
+        top = []
+        scores = []
+        highest = None
+        for record in rows:
+            if len(top) < self.size:
+                top.append(record)
+            scores.append(record['score'])
+            if highest is None or record['id'] > highest:
+                highest = record['id']
+        scores.reverse()
+        #_applied: the ids past _read_up_to added from this worker's notifications
+        return {'_top': top, '_scores': scores, '_read_up_to': highest or 0, '_applied': set()}
+
+    def _insert(self, record):
+        insort(self._scores, record['score'])
+        if len(self._top) < self.size or leaderboard_key(record) < leaderboard_key(self._top[-1]):
+            self._top.append(record)
+            self._top.sort(key=leaderboard_key)
+            del self._top[self.size:]
+
+    def apply(self, action, record):
+        if record['score'] is None:
+            return
+        record = dict(record, score=int(record['score']))
+        if action == 'insert':
+            self._insert(record)
+            if record['id'] > self._read_up_to:
+                self._applied.add(record['id'])
+        elif action == 'delete':
+            del self._scores[bisect_left(self._scores, record['score'])]
+            if any(player['id'] == record['id'] for player in self._top):
+                #the next best player is not cached
+                raise StaleIndex()
+        else:
+            raise StaleIndex()
+
+    def refresh(self, signature):
+        count, highest = self._signature
+        if signature[0] < count or (signature[1] or 0) <= self._read_up_to:
+            #players were deleted or changed elsewhere
+            self.rebuild()
+            return
+        read_up_to = self._read_up_to
+        added = [{'id': id, 'name': name, 'score': score}
+                 for id, name, score in self.ranked_query().filter(Player.id > read_up_to)]
+        with self._lock:
+            for record in added:
+                if record['id'] not in self._applied:
+                    self._insert(record)
+            self._read_up_to = max([read_up_to] + [record['id'] for record in added])
+            self._applied = {player_id for player_id in self._applied if player_id > self._read_up_to}
+            self._signature = (len(self._scores), max(self._read_up_to, highest or 0))
+
+    def total(self):
+        self.ensure_current()
+        return len(self._scores)
+
+    def page(self, offset, limit):
+        self.ensure_current()
+        with self._lock:
+            if offset + limit <= self.size or len(self._top) == len(self._scores):
+                return list(self._top[offset: offset + limit])
+        return [{'id': id, 'name': name, 'score': score}
+                for id, name, score in self.ranked_query().offset(offset).limit(limit)]
+
+    def rank(self, score):
+        """
+        1 + the number of players with a higher score
+        """
+        self.ensure_current()
+        with self._lock:
+            return len(self._scores) - bisect_right(self._scores, score) + 1
@@ -0,0 +1,211 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, replica_binds
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SLOW_SQL_LOG_LIMIT = 50
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = defaultdict(float)
+
+    def inc(self, amount=1, *label_values):
+        self.values[label_values] += amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for label_values, value in sorted(self.values.items()):
+            yield f'{self.name}{format_labels(self.labels, label_values)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, amount, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, amount)] += 1
+        series[1] += amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{format_labels(self.labels, label_values, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, label_values)} {total}'
+            yield f'{self.name}_count{format_labels(self.labels, label_values)} {cumulative}'
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+
+def count_orm_rows(orm_execute_state):
+    """
+    counts the rows of ORM selects for the Metrics of the current app.
+    registered once on Session: the first do_orm_execute listener returning
+    a result wins, so one listener per app would only ever reach the first
+    """
+    if not orm_execute_state.is_select or not has_app_context():
+        return None
+    metrics = current_app.extensions.get('trivia_metrics')
+    options = orm_execute_state.execution_options
+    if metrics is None or options.get('metrics_counted') \
+            or options.get('yield_per') or options.get('stream_results'):
+        return None
+    #invoke_statement() passes get_bind() an argument Flask-SQLAlchemy's
+    #session does not take, so the statement is executed again flagged
+    frozen = orm_execute_state.session.execute(
+        orm_execute_state.statement,
+        orm_execute_state.parameters,
+        execution_options=dict(orm_execute_state.local_execution_options, metrics_counted=True),
+        bind_arguments=dict(orm_execute_state.bind_arguments)
+    ).freeze()
+    metrics.count_rows(len(frozen.data))
+    return frozen()
+
+
+class Metrics:
+    """
+    Metrics
+        request and database instrumentation exposed in the Prometheus text
+        format on /metrics. request hooks time every request per endpoint;
+        engine events count SQL statements and their time, the ORM execute
+        hook counts the rows fetched (streamed yield_per queries are not
+        counted) and the pool checkout is timed. with SLOW_REQUEST_THRESHOLD
+        (seconds) set, slower requests are logged with their SQL
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_duration = Histogram('trivia_http_request_duration_seconds', 'Request latency.',
+                                          ('endpoint', 'method', 'status'))
+        self.sql_statements = Counter('trivia_sql_statements_total', 'SQL statements executed.', ('endpoint',))
+        self.sql_duration = Counter('trivia_sql_duration_seconds_total', 'Time spent executing SQL statements.', ('endpoint',))
+        self.sql_rows = Counter('trivia_sql_rows_fetched_total', 'Rows fetched by ORM queries.', ('endpoint',))
+        self.pool_wait = Histogram('trivia_db_pool_wait_seconds', 'Time waiting for a pooled connection.',
+                                   buckets=POOL_WAIT_BUCKETS)
+        self._registered = []
+        self._instrumented = set()
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.render_response)
+        app.extensions['trivia_metrics'] = self
+        if not event.contains(Session, 'do_orm_execute', count_orm_rows):
+            event.listen(Session, 'do_orm_execute', count_orm_rows)
+        for bind in [None] + replica_binds(app):
+            self.instrument_engine(db.get_engine(app, bind=bind))
+
+    def instrument_engine(self, engine):
+        if id(engine) in self._instrumented:
+            return
+        self._instrumented.add(id(engine))
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        #the pool has no event before a checkout starts, so its getter is timed
+        pool = engine.pool
+        do_get = pool._do_get
+
+        def timed_do_get():
+            started = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self.pool_wait.observe(waited)
+        pool._do_get = timed_do_get
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = []
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        with self._lock:
+            self.request_duration.observe(duration, current_endpoint(), request.method, response.status_code)
+
+        threshold = current_app.config.get('SLOW_REQUEST_THRESHOLD')
+        if threshold is not None and duration >= threshold:
+            statements = g.get('metrics_sql', [])
+            current_app.logger.warning(
+                'slow request %s %s: %.1f ms, %d SQL statements (%.1f ms)\n%s',
+                request.method, request.full_path, duration * 1000, len(statements),
+                sum(seconds for _, seconds in statements) * 1000,
+                '\n'.join(f'  [{seconds * 1000:.1f} ms] {statement}' for statement, seconds in statements[:SLOW_SQL_LOG_LIMIT])
+            )
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['metrics_started'].pop()
+        endpoint = current_endpoint()
+        with self._lock:
+            self.sql_statements.inc(1, endpoint)
+            self.sql_duration.inc(seconds, endpoint)
+        if has_request_context() and 'metrics_sql' in g:
+            g.metrics_sql.append((statement, seconds))
+
+    def count_rows(self, rows):
+        with self._lock:
+            self.sql_rows.inc(rows, current_endpoint())
+
+    def register(self, *metrics):
+        """
+        adds counters or histograms kept by other components to /metrics
+        """
+        self._registered.extend(metrics)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_duration, self.sql_statements, self.sql_duration, self.sql_rows, self.pool_wait):
+                lines.extend(metric.render())
+        for metric in self._registered:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def render_response(self):
+        return current_app.response_class(self.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,231 @@
+import random
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from models import db, Question
+from .indexes import QuestionIndex, StaleIndex
+
+
+ALIAS_CACHE_SIZE = 256
+WEIGHTED_DRAW_ATTEMPTS = 8
+
+
+class AliasTable:
+    """
+    AliasTable
+        Walker's alias method: O(n) to build over n weighted items, then
+        every draw is one uniform pick and one coin flip
+    """
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        count = len(self.items)
+        total = float(sum(weights))
+        scaled = [weight * count / total for weight in weights]
+        self.probability = [1.0] * count
+        self.alias = list(range(count))
+        small = [index for index, weight in enumerate(scaled) if weight < 1]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+
+    def draw(self):
+        index = random.randrange(len(self.items))
+        return self.items[index if random.random() < self.probability[index] else self.alias[index]]
+
+
+def excluded_positions(ids, exclude):
+    """
+    the sorted positions in the sorted array `ids` of the ids of `exclude`
+    """
+    positions = set()
+    for question_id in exclude:
+        if isinstance(question_id, int):
+            position = bisect_left(ids, question_id)
+            if position < len(ids) and ids[position] == question_id:
+                positions.add(position)
+    return sorted(positions)
+
+
+def unseen_ids(ids, exclude, count):
+    """
+    up to `count` distinct random ids of the sorted array `ids` not in
+    `exclude`: random ranks among the remaining ids are mapped past the
+    excluded positions, so the array is never scanned
+    """
+    excluded = excluded_positions(ids, exclude)
+    remaining = len(ids) - len(excluded)
+    picked = []
+    skipped = 0
+    for rank in sorted(random.sample(range(remaining), min(count, remaining))):
+        #the rank-th remaining id sits past every excluded position before it
+        while skipped < len(excluded) and excluded[skipped] <= rank + skipped:
+            skipped += 1
+        picked.append(ids[rank + skipped])
+    random.shuffle(picked)
+    return picked
+
+
+class QuestionIdIndex(QuestionIndex):
+    """
+    QuestionIdIndex
+        the sorted question ids of every category (and of all questions,
+        category 0) in compact integer arrays, and the same split per
+        (category, difficulty) bucket. built on first use from the id,
+        category and difficulty columns only, then kept current on
+        Question.insert and delete. a uniform draw never scans a category:
+        the excluded ids are located by binary search and random ranks
+        among the remaining ids are mapped past them.
+
+        weighted draws pick a bucket from a Walker alias table (bucket size
+        times its category and difficulty weights) and then an id in it.
+        the tables are cached per scope and weights; an insert or delete
+        drops only the tables whose scope covers the changed bucket
+    """
+
+    def rows(self):
+        return ({'id': id, 'category': category, 'difficulty': difficulty}
+                for id, category, difficulty in db.session.query(Question.id, Question.category, Question.difficulty))
+
+    def build(self, rows):
+        buckets = {}
+        for record in rows:
+            buckets.setdefault((record['category'], record['difficulty']), []).append(record['id'])
+        buckets = {bucket: array('q', sorted(ids)) for bucket, ids in buckets.items()}
+        by_category = {}
+        for (category, _), ids in buckets.items():
+            by_category.setdefault(category, []).extend(ids)
+        return {
+            '_buckets': buckets,
+            '_by_category': {category: array('q', sorted(ids)) for category, ids in by_category.items()},
+            '_all': array('q', sorted(question_id for ids in buckets.values() for question_id in ids)),
+            '_alias_tables': OrderedDict()
+        }
+
+    def apply(self, action, record):
+        bucket = (record['category'], record['difficulty'])
+        if action == 'insert':
+            for ids in (self._all, self._by_category.setdefault(record['category'], array('q')),
+                        self._buckets.setdefault(bucket, array('q'))):
+                insort(ids, record['id'])
+        elif action == 'delete':
+            for ids in (self._all, self._by_category.get(record['category']), self._buckets.get(bucket)):
+                position = bisect_left(ids, record['id']) if ids is not None else None
+                if position is None or position == len(ids) or ids[position] != record['id']:
+                    raise StaleIndex()
+                del ids[position]
+        else:
+            #the previous category of an updated question is not known
+            raise StaleIndex()
+
+        for key in list(self._alias_tables):
+            category, difficulty_range = key[0], key[1]
+            if category in (0, bucket[0]) and in_range(bucket[1], difficulty_range):
+                del self._alias_tables[key]
+
+    def _scope(self, category, difficulty_range, difficulty_weights, category_weights):
+        buckets, weights = [], []
+        for bucket, ids in self._buckets.items():
+            if not ids or category not in (0, bucket[0]) or not in_range(bucket[1], difficulty_range):
+                continue
+            weight = (difficulty_weights or {}).get(bucket[1], 1) * (category_weights or {}).get(bucket[0], 1)
+            if weight > 0:
+                buckets.append(bucket)
+                weights.append(weight)
+        return buckets, weights
+
+    def _alias_table(self, category, difficulty_range, difficulty_weights, category_weights):
+        key = (category, difficulty_range, tuple(sorted((difficulty_weights or {}).items())),
+               tuple(sorted((category_weights or {}).items())))
+        table = self._alias_tables.get(key)
+        if table is None:
+            buckets, weights = self._scope(category, difficulty_range, difficulty_weights, category_weights)
+            table = AliasTable(buckets, [weight * len(self._buckets[bucket]) for bucket, weight in zip(buckets, weights)]) if buckets else False
+            self._alias_tables[key] = table
+            if len(self._alias_tables) > ALIAS_CACHE_SIZE:
+                self._alias_tables.popitem(last=False)
+        else:
+            self._alias_tables.move_to_end(key)
+        return table
+
+    def sample(self, category, exclude=(), count=1, difficulty_range=None, difficulty_weights=None, category_weights=None):
+        """
+        returns up to `count` distinct random ids of `category` (0 for every
+        category) that are not in `exclude`, an empty list once every id is
+        excluded and None when the category has no questions.
+
+        `difficulty_range` (min, max) narrows the draw, and the
+        `difficulty_weights` / `category_weights` dicts make a question of
+        difficulty d in category c `weight[d] * weight[c]` times as likely
+        (missing keys weigh 1, 0 leaves them out)
+        """
+        self.ensure_current()
+        with self._lock:
+            if difficulty_range is None and difficulty_weights is None and category_weights is None:
+                ids = self._all if category == 0 else self._by_category.get(category)
+                return unseen_ids(ids, exclude, count) if ids else None
+
+            table = self._alias_table(category, difficulty_range, difficulty_weights, category_weights)
+            if not table:
+                return None
+
+            #draws against the whole buckets, retrying the excluded ids
+            excluded = set(exclude)
+            picked = []
+            for _ in range(count * WEIGHTED_DRAW_ATTEMPTS):
+                if len(picked) == count:
+                    return picked
+                ids = self._buckets[table.draw()]
+                question_id = ids[random.randrange(len(ids))]
+                if question_id not in excluded:
+                    excluded.add(question_id)
+                    picked.append(question_id)
+
+            #mostly excluded: weights over the ids actually left
+            buckets, weights = self._scope(category, difficulty_range, difficulty_weights, category_weights)
+            remaining = [len(self._buckets[bucket]) - len(excluded_positions(self._buckets[bucket], excluded)) for bucket in buckets]
+            while len(picked) < count and any(remaining):
+                index = AliasTable(range(len(buckets)), [weight * left for weight, left in zip(weights, remaining)]).draw()
+                question_id = unseen_ids(self._buckets[buckets[index]], excluded, 1)[0]
+                excluded.add(question_id)
+                picked.append(question_id)
+                remaining[index] -= 1
+            return picked
+
+
+def in_range(difficulty, difficulty_range):
+    if difficulty_range is None:
+        return True
+    return difficulty is not None and difficulty_range[0] <= difficulty <= difficulty_range[1]
+
+
+def draw_options(payload):
+    """
+    the sample() keyword arguments of a quiz request: `difficulty` is one
+    difficulty or a [min, max] range, `difficulty_weights` and
+    `category_weights` map a difficulty or category id to a non-negative
+    weight. raises ValueError on a malformed value
+    """
+    options = {}
+    difficulty = payload.get('difficulty')
+    if difficulty is not None:
+        bounds = difficulty if isinstance(difficulty, list) else [difficulty, difficulty]
+        if len(bounds) != 2 or not all(type(bound) == int for bound in bounds) or bounds[0] > bounds[1]:
+            raise ValueError('difficulty')
+        options['difficulty_range'] = tuple(bounds)
+    for name in ('difficulty_weights', 'category_weights'):
+        weights = payload.get(name)
+        if weights is None:
+            continue
+        if not isinstance(weights, dict):
+            raise ValueError(name)
+        parsed = {int(key): weight for key, weight in weights.items()}
+        if not all(type(weight) in (int, float) and weight >= 0 for weight in parsed.values()):
+            raise ValueError(name)
+        options[name] = parsed
+    return options
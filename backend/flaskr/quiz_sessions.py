@@ -0,0 +1,174 @@
+import os
+import random
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+QUIZ_SESSION_TTL = 60 * 60
+MAX_QUIZ_SESSIONS = 10000
+QUIZ_SESSION_PATH = os.path.join(tempfile.gettempdir(), 'trivia-quiz-sessions.db')
+
+
+class QuizSessionStore:
+    """
+    QuizSessionStore
+        keeps a pre-shuffled deck of question ids per running quiz, so the
+        client only sends back a short token and every draw is a list pop.
+        sessions live in the worker's memory: they expire after `ttl` seconds
+        without use and the least recently used one is dropped once
+        `max_sessions` is reached. a session is only found by the worker that
+        started it, so multi-worker deployments use SQLiteQuizSessionStore or
+        route a session's requests to one worker
+    """
+
+    def __init__(self, ttl=QUIZ_SESSION_TTL, max_sessions=MAX_QUIZ_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def _purge(self, now):
+        while self._sessions:
+            token, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used < self.ttl and len(self._sessions) < self.max_sessions:
+                break
+            del self._sessions[token]
+
+    def start(self, question_ids):
+        deck = list(question_ids)
+        random.shuffle(deck)
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._sessions[token] = (now, deck)
+        return token
+
+    def draw(self, token):
+        """
+        returns the next question id of the deck, or None when it is empty.
+        raises KeyError for unknown or expired sessions
+        """
+        now = time.monotonic()
+        with self._lock:
+            last_used, deck = self._sessions[token]
+            if now - last_used >= self.ttl:
+                del self._sessions[token]
+                raise KeyError(token)
+            self._sessions[token] = (now, deck)
+            self._sessions.move_to_end(token)
+            return deck.pop() if deck else None
+
+    def end(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+
+class SQLiteQuizSessionStore:
+    """
+    SQLiteQuizSessionStore
+        the same decks in a SQLite file shared by every worker of the host,
+        one row per question id, so a draw is one indexed read and delete
+        whichever worker the request reaches. like the SQLite response cache
+        the file can be placed on a tmpfs (/dev/shm)
+    """
+
+    def __init__(self, path=QUIZ_SESSION_PATH, ttl=QUIZ_SESSION_TTL, max_sessions=MAX_QUIZ_SESSIONS):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+
+    def _connection(self):
+        #sqlite connections are neither shared between threads nor across a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS quiz_sessions (token TEXT PRIMARY KEY, used_at REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_quiz_sessions_used_at ON quiz_sessions (used_at)')
+            connection.execute('CREATE TABLE IF NOT EXISTS quiz_decks (token TEXT, position INTEGER, question_id INTEGER, '
+                               'PRIMARY KEY (token, position)) WITHOUT ROWID')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _delete(self, connection, tokens):
+        connection.executemany('DELETE FROM quiz_decks WHERE token = ?', tokens)
+        connection.executemany('DELETE FROM quiz_sessions WHERE token = ?', tokens)
+
+    def _purge(self, connection, now):
+        expired = connection.execute('SELECT token FROM quiz_sessions WHERE used_at <= ?', (now - self.ttl,)).fetchall()
+        excess = connection.execute('SELECT COUNT(*) FROM quiz_sessions').fetchone()[0] - len(expired) - self.max_sessions + 1
+        if excess > 0:
+            expired += connection.execute('SELECT token FROM quiz_sessions WHERE used_at > ? ORDER BY used_at LIMIT ?',
+                                          (now - self.ttl, excess)).fetchall()
+        self._delete(connection, expired)
+
+    def start(self, question_ids):
+        deck = list(question_ids)
+        random.shuffle(deck)
+        token = secrets.token_urlsafe(16)
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._purge(connection, now)
+            connection.execute('INSERT INTO quiz_sessions (token, used_at) VALUES (?, ?)', (token, now))
+            connection.executemany('INSERT INTO quiz_decks (token, position, question_id) VALUES (?, ?, ?)',
+                                   ((token, position, question_id) for position, question_id in enumerate(deck)))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return token
+
+    def draw(self, token):
+        """
+        returns the next question id of the deck, or None when it is empty.
+        raises KeyError for unknown or expired sessions
+        """
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT used_at FROM quiz_sessions WHERE token = ?', (token,)).fetchone()
+            expired = row is None or now - row[0] >= self.ttl
+            card = None
+            if expired:
+                self._delete(connection, [(token,)])
+            else:
+                card = connection.execute('SELECT position, question_id FROM quiz_decks WHERE token = ? '
+                                          'ORDER BY position DESC LIMIT 1', (token,)).fetchone()
+                if card is not None:
+                    connection.execute('DELETE FROM quiz_decks WHERE token = ? AND position = ?', (token, card[0]))
+                connection.execute('UPDATE quiz_sessions SET used_at = ? WHERE token = ?', (now, token))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        if expired:
+            raise KeyError(token)
+        return card[1] if card is not None else None
+
+    def end(self, token):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._delete(connection, [(token,)])
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+
+def make_quiz_session_store(name, ttl=QUIZ_SESSION_TTL, path=QUIZ_SESSION_PATH):
+    """
+    returns the QUIZ_SESSION_STORE: 'memory' (the default) or 'sqlite'
+    """
+    if name == 'sqlite':
+        return SQLiteQuizSessionStore(path, ttl)
+    return QuizSessionStore(ttl)
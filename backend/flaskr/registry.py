@@ -0,0 +1,47 @@
+import threading
+import time
+
+from models import Category, data_version, primary_reads
+
+CATEGORY_CACHE_TTL = 60
+
+
+class CategoryRegistry:
+    """
+    CategoryRegistry
+        serves the {id: type} category map from memory.
+        the map is reloaded when the categories data version changes (any
+        Category.insert/update/delete in this worker) or when it is older
+        than `ttl` seconds, so writes made by other workers converge too
+    """
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _is_fresh(self, snapshot):
+        if snapshot is None:
+            return False
+        version, loaded_at, _ = snapshot
+        return version == data_version(Category.__tablename__) and time.monotonic() - loaded_at < self.ttl
+
+    def categories(self):
+        snapshot = self._snapshot
+        if not self._is_fresh(snapshot):
+            with self._lock:
+                snapshot = self._snapshot
+                if not self._is_fresh(snapshot):
+                    #read the version first so a concurrent write forces another reload
+                    version = data_version(Category.__tablename__)
+                    with primary_reads():
+                        rows = Category.query.with_entities(Category.id, Category.type).all()
+                    snapshot = (version, time.monotonic(), {id: type for id, type in rows})
+                    self._snapshot = snapshot
+        return snapshot[2]
+
+    def get(self, category_id):
+        return self.categories().get(category_id)
+
+    def invalidate(self):
+        self._snapshot = None
@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from models import add_change_listener, data_version, primary_reads
+from .metrics import Counter
+
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+RESPONSE_CACHE_TTL = 60
+RESPONSE_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'trivia-response-cache.db')
+#seconds between two LRU touches of the same SQLite entry
+RESPONSE_CACHE_TOUCH_INTERVAL = 10
+
+
+class MemoryCacheBackend:
+    """
+    MemoryCacheBackend
+        LRU of encoded responses inside the worker process, bounded by the
+        total size of the bodies
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._generations = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, stored_at, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (stored_at, body, mimetype)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def generations(self, tables):
+        return [self._generations.get(table, 0) for table in tables]
+
+    def bump(self, table):
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+
+
+class SQLiteCacheBackend:
+    """
+    SQLiteCacheBackend
+        the same LRU in a SQLite file shared by every worker of the host, so
+        a page encoded by one worker is a hit for the others. the generations
+        live in the file too: a write in any worker invalidates for all.
+        placed on a tmpfs (/dev/shm) the file stays in shared memory. a hit
+        only writes its use time when the stored one is older than
+        RESPONSE_CACHE_TOUCH_INTERVAL, so hot pages are read without taking
+        the write lock on every request
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connection(self):
+        #sqlite connections are neither shared between threads nor across a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, stored_at REAL, '
+                               'used_at REAL, size INTEGER, body BLOB, mimetype TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_responses_used_at ON responses (used_at)')
+            connection.execute('CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute('SELECT stored_at, used_at, body, mimetype FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] >= RESPONSE_CACHE_TOUCH_INTERVAL:
+            try:
+                connection.execute('UPDATE responses SET used_at = ? WHERE key = ?', (now, key))
+            except sqlite3.OperationalError:
+                #only the eviction order; another hit will touch it
+                pass
+        return row[0], bytes(row[2]), row[3]
+
+    def set(self, key, stored_at, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR REPLACE INTO responses (key, stored_at, used_at, size, body, mimetype) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', (key, stored_at, time.time(), len(body), body, mimetype))
+            excess = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0] - self.max_bytes
+            if excess > 0:
+                evicted = []
+                for evicted_key, size in connection.execute('SELECT key, size FROM responses ORDER BY used_at'):
+                    evicted.append((evicted_key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def generations(self, tables):
+        rows = dict(self._connection().execute(
+            f'SELECT name, value FROM generations WHERE name IN ({", ".join("?" * len(tables))})', tables))
+        return [rows.get(table, 0) for table in tables]
+
+    def bump(self, table):
+        self._connection().execute('INSERT INTO generations (name, value) VALUES (?, 1) '
+                                   'ON CONFLICT (name) DO UPDATE SET value = value + 1', (table,))
+
+
+def make_cache_backend(name, max_bytes=RESPONSE_CACHE_MAX_BYTES, path=RESPONSE_CACHE_PATH):
+    """
+    returns the RESPONSE_CACHE backend: 'memory' (the default), 'sqlite',
+    or None for 'none'
+    """
+    if name == 'none':
+        return None
+    if name == 'sqlite':
+        return SQLiteCacheBackend(path, max_bytes)
+    return MemoryCacheBackend(max_bytes)
+
+
+class ResponseCache:
+    """
+    ResponseCache
+        keeps the encoded bytes of successful GET responses, keyed by the
+        endpoint, its arguments and the generation of the tables it reads.
+        model changes (Question.insert/delete, Category.insert...) bump the
+        generation, so later requests miss and the old pages age out of the
+        LRU. data versions moved without a notification (bulk imports) are
+        noticed on the next lookup, and entries older than `ttl` seconds
+        are not served so changes made outside the app converge too. a
+        backend error (a locked SQLite file...) is logged and the request
+        is served as a miss: the cache never fails a request
+    """
+
+    def __init__(self, backend, ttl=RESPONSE_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._seen_versions = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.hits = Counter('trivia_response_cache_hits_total', 'Responses served from the response cache.', ('endpoint',))
+        self.misses = Counter('trivia_response_cache_misses_total', 'Cacheable responses that had to be built.', ('endpoint',))
+        if backend is not None:
+            add_change_listener(self._on_change)
+
+    def init_app(self, app):
+        self.logger = app.logger
+        metrics = app.extensions.get('trivia_metrics')
+        if metrics is not None:
+            metrics.register(self.hits, self.misses)
+
+    def _on_change(self, table, action, record):
+        version = data_version(table)
+        try:
+            self.backend.bump(table)
+        except Exception:
+            #left unseen, so the next lookup bumps it again
+            self.logger.warning('could not invalidate the cached %s responses', table, exc_info=True)
+            return
+        self._seen_versions[table] = version
+
+    def _generations(self, tables):
+        for table in tables:
+            version = data_version(table)
+            if self._seen_versions.setdefault(table, version) != version:
+                self.backend.bump(table)
+                self._seen_versions[table] = version
+        return self.backend.generations(tables)
+
+    def key(self, tables):
+        arguments = sorted(request.args.items(multi=True))
+        view_arguments = sorted((request.view_args or {}).items())
+        raw = f'{request.endpoint}|{view_arguments}|{arguments}|{self._generations(tables)}'
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def cached(self, *tables):
+        """
+        cached(*tables)
+            serves the view's GET responses from the cache, `tables` being
+            the tables its response is built from
+        """
+        def decorator(view):
+            if self.backend is None:
+                return view
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                try:
+                    key = self.key(tables)
+                    entry = self.backend.get(key)
+                except Exception:
+                    self.logger.warning('response cache lookup failed', exc_info=True)
+                    key = entry = None
+                if entry is not None and time.time() - entry[0] < self.ttl:
+                    with self._lock:
+                        self.hits.inc(1, request.endpoint)
+                    return current_app.response_class(entry[1], mimetype=entry[2])
+
+                with self._lock:
+                    self.misses.inc(1, request.endpoint)
+                #the entry is keyed on the current generations and served to
+                #every client, so it is rendered from the primary: a lagging
+                #replica would keep an old body under the new key
+                with primary_reads():
+                    response = make_response(view(*args, **kwargs))
+                if key is not None and response.status_code == 200 and not response.is_streamed:
+                    try:
+                        self.backend.set(key, time.time(), response.get_data(), response.mimetype)
+                    except Exception:
+                        self.logger.warning('could not store a response in the cache', exc_info=True)
+                return response
+            return wrapper
+        return decorator
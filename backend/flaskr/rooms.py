@@ -0,0 +1,217 @@
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .metrics import Counter
+from .serialization import dumps
+
+ROOM_TTL = 4 * 60 * 60
+MAX_ROOMS = 1000
+ROOM_QUEUE_SIZE = 64
+ROOM_KEEPALIVE = 15
+KEEPALIVE = b': keepalive\n\n'
+
+
+def sse_message(event, payload):
+    """
+    one Server-Sent Event, encoded once and shared by every subscriber
+    """
+    data = dumps(payload)
+    if isinstance(data, str):
+        data = data.encode()
+    return b'event: ' + event.encode() + b'\ndata: ' + data.rstrip() + b'\n\n'
+
+
+class Subscriber:
+    """
+    Subscriber
+        the bounded queue of encoded events of one connected client. a client
+        that falls `size` events behind is dropped instead of making the
+        room buffer without limit; its stream ends and the EventSource
+        reconnects to a fresh snapshot
+    """
+
+    def __init__(self, size=ROOM_QUEUE_SIZE):
+        self.size = size
+        self.dropped = False
+        self.closed = False
+        self._messages = deque()
+        self._ready = threading.Condition()
+
+    def push(self, message):
+        with self._ready:
+            if self.dropped or self.closed:
+                return False
+            if len(self._messages) >= self.size:
+                self.dropped = True
+                self._messages.clear()
+            else:
+                self._messages.append(message)
+            self._ready.notify()
+            return not self.dropped
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+
+    def pull(self, timeout):
+        """
+        returns the next message, KEEPALIVE when none came within `timeout`
+        seconds, or None once the subscriber is dropped or closed and drained
+        """
+        with self._ready:
+            if not self._messages and not self.dropped and not self.closed:
+                self._ready.wait(timeout)
+            if self._messages:
+                return self._messages.popleft()
+            if self.dropped or self.closed:
+                return None
+            return KEEPALIVE
+
+
+class Room:
+    """
+    Room
+        a live quiz: the host draws the questions of a shuffled deck one at a
+        time and the players' scores are kept in memory until the end. every
+        change is published to the subscribers as one encoded event
+    """
+
+    def __init__(self, question_ids, host_token):
+        self.deck = list(question_ids)
+        random.shuffle(self.deck)
+        self.host_token = host_token
+        self.total_questions = len(self.deck)
+        self.question = None
+        self.answer = None
+        self.scores = {}
+        self.answered = set()
+        self.subscribers = set()
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        return sse_message('state', {
+            'question': self.question,
+            'scores': self.scores,
+            'total_questions': self.total_questions,
+            'remaining_questions': len(self.deck)
+        })
+
+    def publish(self, event, payload):
+        """
+        encodes the event once and queues it for every subscriber. returns
+        the subscribers dropped for being too slow
+        """
+        message = sse_message(event, payload)
+        dropped = [subscriber for subscriber in self.subscribers if not subscriber.push(message)]
+        self.subscribers.difference_update(dropped)
+        return dropped
+
+
+class RoomStore:
+    """
+    RoomStore
+        the rooms of the worker, like QuizSessionStore: a room expires `ttl`
+        seconds after its last use and the least recently used one is
+        dropped once `max_rooms` is reached. a room's subscribers must reach
+        the worker holding it, so multi-worker deployments route a room's
+        requests to one worker (sticky sessions on the room id)
+    """
+
+    def __init__(self, ttl=ROOM_TTL, max_rooms=MAX_ROOMS, queue_size=ROOM_QUEUE_SIZE, keepalive=ROOM_KEEPALIVE):
+        self.ttl = ttl
+        self.max_rooms = max_rooms
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._rooms = OrderedDict()
+        self.dropped = Counter('trivia_room_dropped_subscribers_total', 'Room subscribers dropped for falling behind.')
+        self.broadcasts = Counter('trivia_room_broadcasts_total', 'Events published to quiz rooms.', ('event',))
+
+    def init_app(self, app):
+        metrics = app.extensions.get('trivia_metrics')
+        if metrics is not None:
+            metrics.register(self.dropped, self.broadcasts)
+
+    def _purge(self, now):
+        while self._rooms:
+            room_id, (last_used, room) = next(iter(self._rooms.items()))
+            if now - last_used < self.ttl and len(self._rooms) < self.max_rooms:
+                break
+            del self._rooms[room_id]
+            self._close(room)
+
+    def _close(self, room):
+        with room.lock:
+            room.closed = True
+            for subscriber in room.subscribers:
+                subscriber.close()
+            room.subscribers.clear()
+
+    def create(self, question_ids):
+        room_id = secrets.token_urlsafe(8)
+        room = Room(question_ids, secrets.token_urlsafe(16))
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._rooms[room_id] = (now, room)
+        return room_id, room
+
+    def get(self, room_id):
+        """
+        returns the room, raises KeyError for unknown or expired rooms
+        """
+        now = time.monotonic()
+        with self._lock:
+            last_used, room = self._rooms[room_id]
+            if now - last_used >= self.ttl:
+                del self._rooms[room_id]
+                self._close(room)
+                raise KeyError(room_id)
+            self._rooms[room_id] = (now, room)
+            self._rooms.move_to_end(room_id)
+            return room
+
+    def publish(self, room, event, payload):
+        #called with room.lock held, which get() may wait for while holding
+        #self._lock: the counters have their own lock
+        dropped = room.publish(event, payload)
+        with self._metrics_lock:
+            self.broadcasts.inc(1, event)
+            self.dropped.inc(len(dropped))
+
+    def end(self, room_id, room):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+        self._close(room)
+
+    def stream(self, room):
+        """
+        the event stream of a new subscriber: the current state of the room,
+        then its events as they are published, keepalive comments in between
+        """
+        subscriber = Subscriber(self.queue_size)
+        with room.lock:
+            snapshot = room.snapshot()
+            if room.closed:
+                subscriber.close()
+            else:
+                room.subscribers.add(subscriber)
+
+        def events():
+            try:
+                yield snapshot
+                while True:
+                    message = subscriber.pull(self.keepalive)
+                    if message is None:
+                        return
+                    yield message
+            finally:
+                with room.lock:
+                    room.subscribers.discard(subscriber)
+        return events()
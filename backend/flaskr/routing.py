@@ -0,0 +1,50 @@
+import random
+
+from flask import current_app, g, request
+
+from models import replica_binds
+
+PRIMARY_COOKIE = 'trivia_primary'
+REPLICA_STICKY_SECONDS = 5
+
+
+def replica_reads(view):
+    """
+    marks a view that is not a GET but whose queries may be served by a
+    replica; the session still moves to the primary once the view writes
+    """
+    view.replica_reads = True
+    return view
+
+
+class ReadRouter:
+    """
+    ReadRouter
+        with replicas configured (DATABASE_REPLICA_URLS), GET requests and
+        views marked with @replica_reads read from one of them, picked per
+        request. a request that wrote sets a cookie sending the client's
+        requests to the primary for DB_REPLICA_STICKY_SECONDS, so clients
+        read their own writes whatever the replication lag
+    """
+
+    def init_app(self, app):
+        self.binds = replica_binds(app)
+        if not self.binds:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.pop('db_wrote', None)
+        g.pop('db_replica', None)
+        view = current_app.view_functions.get(request.endpoint)
+        reads_only = request.method in ('GET', 'HEAD') or getattr(view, 'replica_reads', False)
+        if reads_only and PRIMARY_COOKIE not in request.cookies:
+            g.db_replica = random.choice(self.binds)
+
+    def _after_request(self, response):
+        if g.pop('db_wrote', False):
+            sticky = current_app.config.get('DB_REPLICA_STICKY_SECONDS', REPLICA_STICKY_SECONDS)
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=sticky, httponly=True, samesite='Lax')
+        g.pop('db_replica', None)
+        return response
@@ -0,0 +1,119 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from models import db, Player
+
+SCORE_BATCH_SIZE = 100
+SCORE_FLUSH_INTERVAL = 1.0
+SCORE_QUEUE_SIZE = 10000
+
+
+class ScoreWriter:
+    """
+    ScoreWriter
+        records end of quiz scores. in synchronous mode (the default) every
+        score is inserted inside the request. in write-behind mode scores are
+        queued and a background thread inserts them in one transaction per
+        `batch_size` scores or per `flush_interval` seconds, whichever comes
+        first. a full queue falls back to a synchronous insert, and pending
+        scores are flushed when the process exits. a batch that fails is
+        written again one score at a time, so one bad row only loses itself
+    """
+
+    def __init__(self, app, synchronous=True, batch_size=SCORE_BATCH_SIZE,
+                 flush_interval=SCORE_FLUSH_INTERVAL, queue_size=SCORE_QUEUE_SIZE):
+        self.app = app
+        self.synchronous = synchronous
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def record(self, name, score):
+        self.record_many([(name, score)])
+
+    def record_many(self, scores):
+        """
+        records (name, score) pairs, inserted in one transaction in
+        synchronous mode
+        """
+        scores = list(scores)
+        #the request has answered by the time a queued score is written
+        for name, score in scores:
+            if type(score) != int:
+                raise ValueError(f'score must be an integer, not {score!r}')
+            if not isinstance(name, str):
+                raise ValueError(f'name must be a string, not {name!r}')
+        if not self.synchronous:
+            pending = self._ensure_worker()
+            overflow = []
+            for item in scores:
+                try:
+                    pending.put_nowait(item)
+                except queue.Full:
+                    overflow.append(item)
+            scores = overflow
+        if scores:
+            Player.insert_many([Player(name=name, score=score) for name, score in scores])
+
+    def _ensure_worker(self):
+        #a worker started before a fork does not exist in the child
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.queue_size)
+                    self._thread = threading.Thread(target=self._run, args=(self._queue,), name='score-writer', daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+                    atexit.register(self.close)
+        return self._queue
+
+    def _run(self, pending):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = pending.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                Player.insert_many([Player(name=name, score=score) for name, score in batch])
+                return
+            except Exception:
+                self.app.logger.warning('could not record %d scores at once, retrying one by one',
+                                        len(batch), exc_info=True)
+            for name, score in batch:
+                try:
+                    Player(name=name, score=score).insert()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('could not record the score of %r', name)
+
+    def close(self):
+        """
+        stops the background thread after it has written every queued score
+        """
+        with self._lock:
+            thread, pending = self._thread, self._queue
+            if thread is None or self._pid != os.getpid():
+                return
+            self._thread = self._queue = self._pid = None
+        pending.put(None)
+        thread.join()
@@ -0,0 +1,278 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from sqlalchemy import text
+
+from models import Question
+from .indexes import QuestionIndex
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+FUZZY_SIMILARITY_THRESHOLD = 0.6
+FUZZY_MAX_CANDIDATES = 5000
+
+
+def tokenize(value):
+    return [token.lower() for token in TOKEN_PATTERN.findall(value or '')]
+
+
+def trigrams(value):
+    """
+    trigrams of every word padded like pg_trgm does ('  w', ' wo', ..., 'd ')
+    """
+    grams = set()
+    for token in tokenize(value):
+        padded = f'  {token} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def order_by_ids(questions, question_ids):
+    by_id = {question.id: question for question in questions}
+    return [by_id[question_id] for question_id in question_ids if question_id in by_id]
+
+
+def fetch_in_order(question_ids):
+    if not question_ids:
+        return []
+    questions = Question.query.filter(Question.id.in_(question_ids)).all()
+    return order_by_ids(questions, question_ids)
+
+
+def in_category(record_category, category):
+    return not category or record_category == category
+
+
+class PostgresSearchBackend:
+    """
+    PostgresSearchBackend
+        ranked full-text search on the `questions.search_vector` tsvector
+        column and its GIN index (see the add_question_search_vector
+        migration). every search word is matched as a prefix, so partial
+        words keep finding questions as the old substring search did.
+        fuzzy search uses pg_trgm word similarity on its trigram index
+    """
+
+    def search(self, term, category=None, page=1, per_page=10):
+        tokens = tokenize(term)
+        if not tokens:
+            return [], 0
+        ts_query = ' & '.join(f'{token}:*' for token in tokens)
+        match = text("questions.search_vector @@ to_tsquery('simple', :ts_query)").bindparams(ts_query=ts_query)
+        rank = text("ts_rank(questions.search_vector, to_tsquery('simple', :ts_query)) DESC").bindparams(ts_query=ts_query)
+
+        query = Question.query.filter(match)
+        if category:
+            query = query.filter_by(category=category)
+        total = query.count()
+        questions = query.order_by(rank, Question.id).offset((page - 1) * per_page).limit(per_page).all()
+        return questions, total
+
+    def fuzzy_search(self, term, category=None, limit=10):
+        if not tokenize(term):
+            return []
+        #<% uses the trigram index, pg_trgm.word_similarity_threshold defaults to 0.6
+        match = text("(:term)::text <% questions.question").bindparams(term=term)
+        similarity = text("word_similarity(:term, questions.question) DESC").bindparams(term=term)
+
+        query = Question.query.filter(match)
+        if category:
+            query = query.filter_by(category=category)
+        return query.order_by(similarity, Question.id).limit(limit).all()
+
+
+class WordIndex(QuestionIndex):
+    """
+    WordIndex
+        inverted index over Question.question: each word maps to
+        {question id: occurrences}. the sorted vocabulary lets words be
+        matched as prefixes like the Postgres backend
+    """
+
+    @staticmethod
+    def _index(postings, documents, record):
+        """
+        adds the question to `postings` and `documents`, returning the words
+        it is the first question of
+        """
+        tokens = tokenize(record['question'])
+        new_words = []
+        for token in tokens:
+            counts = postings[token]
+            if not counts:
+                new_words.append(token)
+            counts[record['id']] = counts.get(record['id'], 0) + 1
+        documents[record['id']] = (len(tokens), record['category'], set(tokens))
+        return new_words
+
+    def build(self, rows):
+        postings = defaultdict(dict)
+        documents = {}
+        for record in rows:
+            self._index(postings, documents, record)
+        return {'_postings': postings, '_documents': documents, '_vocabulary': sorted(postings)}
+
+    def _add(self, record):
+        for word in self._index(self._postings, self._documents, record):
+            insort(self._vocabulary, word)
+
+    def _remove(self, question_id):
+        document = self._documents.pop(question_id, None)
+        if document is None:
+            return
+        for token in document[2]:
+            postings = self._postings[token]
+            del postings[question_id]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def apply(self, action, record):
+        self._remove(record['id'])
+        if action != 'delete':
+            self._add(record)
+
+    def _prefix_matches(self, prefix):
+        matches = {}
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            for question_id, count in self._postings[self._vocabulary[position]].items():
+                matches[question_id] = matches.get(question_id, 0) + count
+            position += 1
+        return matches
+
+    def rank(self, term, category=None):
+        """
+        returns the ids of the questions containing every word of `term`,
+        best match first
+        """
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+        self.ensure_current()
+
+        with self._lock:
+            scores = None
+            for token in tokens:
+                matches = self._prefix_matches(token)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {question_id: score + matches[question_id] for question_id, score in scores.items() if question_id in matches}
+                if not scores:
+                    return []
+            scores = {question_id: score / (1 + math.log(1 + self._documents[question_id][0]))
+                      for question_id, score in scores.items() if in_category(self._documents[question_id][1], category)}
+
+        #word frequency normalised by question length, similar to ts_rank
+        return sorted(scores, key=lambda question_id: (-scores[question_id], question_id))
+
+
+class TrigramIndex(QuestionIndex):
+    """
+    TrigramIndex
+        trigram posting lists over Question.question for typo tolerant
+        search. a question scores the share of the search term's trigrams it
+        contains (close to pg_trgm word_similarity). query trigrams are
+        visited rarest first and no new candidates are admitted past
+        `max_candidates`, which bounds the work per search
+    """
+
+    def __init__(self, threshold=FUZZY_SIMILARITY_THRESHOLD, max_candidates=FUZZY_MAX_CANDIDATES):
+        super().__init__()
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+
+    @staticmethod
+    def _index(postings, documents, record):
+        grams = trigrams(record['question'])
+        for gram in grams:
+            postings[gram].add(record['id'])
+        documents[record['id']] = (grams, record['category'])
+
+    def build(self, rows):
+        postings = defaultdict(set)
+        documents = {}
+        for record in rows:
+            self._index(postings, documents, record)
+        return {'_postings': postings, '_documents': documents}
+
+    def apply(self, action, record):
+        old = self._documents.pop(record['id'], None)
+        if old is not None:
+            for gram in old[0]:
+                postings = self._postings[gram]
+                postings.discard(record['id'])
+                if not postings:
+                    del self._postings[gram]
+        if action != 'delete':
+            self._index(self._postings, self._documents, record)
+
+    def top(self, term, category=None, limit=10):
+        query_grams = trigrams(term)
+        if not query_grams:
+            return []
+        self.ensure_current()
+
+        with self._lock:
+            shared = {}
+            for gram in sorted(query_grams, key=lambda gram: len(self._postings.get(gram, ()))):
+                postings = self._postings.get(gram, set())
+                #the candidates are counted by lookups in the posting set, so
+                #its walk stops as soon as no new candidate can be admitted
+                for question_id in shared:
+                    if question_id in postings:
+                        shared[question_id] += 1
+                if len(shared) >= self.max_candidates:
+                    continue
+                for question_id in postings:
+                    if question_id not in shared:
+                        shared[question_id] = 1
+                        if len(shared) >= self.max_candidates:
+                            break
+            candidates = [(count / len(query_grams), question_id) for question_id, count in shared.items()
+                          if in_category(self._documents[question_id][1], category)]
+
+        matches = [(similarity, question_id) for similarity, question_id in candidates if similarity >= self.threshold]
+        best = heapq.nsmallest(limit, matches, key=lambda match: (-match[0], match[1]))
+        return [question_id for _, question_id in best]
+
+
+class InMemorySearchBackend:
+    """
+    InMemorySearchBackend
+        search for databases without full-text support (SQLite in local runs
+        and tests), answered from in-process word and trigram indexes that are
+        kept current on Question.insert/update/delete
+    """
+
+    def __init__(self):
+        self.words = WordIndex()
+        self.trigrams = TrigramIndex()
+
+    def search(self, term, category=None, page=1, per_page=10):
+        ranked = self.words.rank(term, category)
+        return fetch_in_order(ranked[(page - 1) * per_page: page * per_page]), len(ranked)
+
+    def fuzzy_search(self, term, category=None, limit=10):
+        return fetch_in_order(self.trigrams.top(term, category, limit))
+
+
+SEARCH_BACKENDS = {
+    'postgres': PostgresSearchBackend,
+    'memory': InMemorySearchBackend,
+}
+
+
+def make_search_backend(name, database_uri):
+    """
+    returns the search backend named `name`; when no name is configured
+    Postgres databases use full-text search and everything else the
+    in-process indexes
+    """
+    if name is None:
+        name = 'postgres' if database_uri.startswith('postgresql') else 'memory'
+    return SEARCH_BACKENDS[name]()
@@ -0,0 +1,52 @@
+import json
+
+from flask import current_app, has_app_context
+
+from models import Question
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer, Question.category, Question.difficulty)
+
+
+def question_rows(query):
+    """
+    narrows a Question query to plain column tuples: no ORM objects are
+    built and nothing is added to the session identity map
+    """
+    return query.with_entities(*QUESTION_COLUMNS)
+
+
+def format_question_row(row):
+    """
+    the Question.format() dict of a question_rows() row
+    """
+    id, question, answer, category, difficulty = row
+    return {
+        'id': id,
+        'question': question,
+        'answer': answer,
+        'category': category,
+        'difficulty': difficulty
+    }
+
+
+def dumps(payload):
+    """
+    encodes like jsonify does (sorted keys, compact separators, ASCII
+    escapes, trailing newline), so responses are byte for byte the same.
+    with ORJSON_RESPONSES set in the app config and orjson installed, orjson
+    is used instead. the document parses to the same value but the bytes
+    differ: non-ASCII characters are sent as UTF-8 rather than escaped, and
+    integer keys (the category map) are sorted as strings, 1, 10, 2
+    """
+    if orjson is not None and has_app_context() and current_app.config.get('ORJSON_RESPONSES'):
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n'
+
+
+def json_response(payload, status=200):
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
@@ -26,6 +26,16 @@ config.set_main_option(
         '%', '%%'))
 target_metadata = current_app.extensions['migrate'].db.metadata
 
+# columns maintained only by migrations (not mapped on the models), so
+# autogenerate does not try to drop them
+UNMAPPED_COLUMNS = {('questions', 'search_vector')}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'column' and (object.table.name, name) in UNMAPPED_COLUMNS:
+        return False
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -78,6 +88,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,34 @@
+"""add question search vector
+
+Revision ID: 7c41d9e2a6b8
+Revises: 2ba3f5bd83e3
+Create Date: 2026-10-18 10:12:31.204115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41d9e2a6b8'
+down_revision = '2ba3f5bd83e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # full-text search is Postgres only, other databases use the in-process index
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(
+        "ALTER TABLE questions ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(question, ''))) STORED"
+    )
+    op.create_index('ix_questions_search_vector', 'questions', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_questions_search_vector', table_name='questions')
+    op.drop_column('questions', 'search_vector')
@@ -0,0 +1,31 @@
+"""add question trigram index
+
+Revision ID: b3e85f0c19d4
+Revises: 7c41d9e2a6b8
+Create Date: 2026-10-18 11:40:06.518372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e85f0c19d4'
+down_revision = '7c41d9e2a6b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fuzzy search is backed by pg_trgm on Postgres, other databases use the in-process index
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_questions_question_trgm', 'questions', ['question'],
+                    postgresql_using='gin', postgresql_ops={'question': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_questions_question_trgm', table_name='questions')
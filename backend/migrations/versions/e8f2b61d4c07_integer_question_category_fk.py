@@ -0,0 +1,98 @@
+"""integer question category foreign key
+
+Revision ID: e8f2b61d4c07
+Revises: d5a0c7f3e921
+Create Date: 2026-10-18 14:22:47.093561
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f2b61d4c07'
+down_revision = 'd5a0c7f3e921'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 10000))
+
+
+def category_is_integer(bind):
+    columns = {column['name']: column for column in sa.inspect(bind).get_columns('questions')}
+    return isinstance(columns['category']['type'], sa.Integer)
+
+
+def backfill_postgresql(bind):
+    """
+    copies the text category into a new integer column one id range per
+    transaction, so large tables are never locked for the whole copy. a
+    last catch-up pass for rows written meanwhile runs with the column swap,
+    under the table lock so no write can land between the two. the
+    transaction is left open: the caller commits it
+    """
+    op.execute('ALTER TABLE questions ADD COLUMN category_id integer')
+    convert = "CASE WHEN category ~ '^\\s*[0-9]+\\s*$' THEN trim(category)::integer END"
+
+    low, high = bind.execute(sa.text('SELECT min(id), max(id) FROM questions')).first()
+    if low is not None:
+        with op.get_context().autocommit_block():
+            for start in range(low, high + 1, BACKFILL_BATCH_SIZE):
+                bind.execute(sa.text(f'UPDATE questions SET category_id = {convert} WHERE id >= :start AND id < :end'),
+                             {'start': start, 'end': start + BACKFILL_BATCH_SIZE})
+
+    # the lock DROP COLUMN needs anyway, taken before the catch-up so rows
+    # inserted or recategorized during the backfill are all copied
+    op.execute('LOCK TABLE questions IN ACCESS EXCLUSIVE MODE')
+    op.execute(f'UPDATE questions SET category_id = {convert} WHERE category_id IS DISTINCT FROM {convert}')
+    op.execute('ALTER TABLE questions DROP COLUMN category')
+    op.execute('ALTER TABLE questions RENAME COLUMN category_id TO category')
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.alter_column('category', type_=sa.Integer(), existing_type=sa.String())
+            batch_op.create_foreign_key('fk_questions_category', 'categories', ['category'], ['id'],
+                                        onupdate='CASCADE', ondelete='SET NULL')
+            batch_op.create_index('ix_questions_category_id', ['category', 'id'])
+        return
+
+    if not category_is_integer(bind):
+        backfill_postgresql(bind)
+    else:
+        # no write may add an orphan between the cleanup and the constraint
+        op.execute('LOCK TABLE questions IN SHARE ROW EXCLUSIVE MODE')
+
+    # questions pointing at missing categories get the ON DELETE SET NULL outcome
+    op.execute('UPDATE questions SET category = NULL WHERE category IS NOT NULL '
+               'AND NOT EXISTS (SELECT 1 FROM categories WHERE categories.id = questions.category)')
+    # NOT VALID only checks new rows; entering the autocommit block commits
+    # the swap and releases its lock, so VALIDATE checks the existing rows
+    # in its own transaction, under a lock that lets writes through
+    op.execute('ALTER TABLE questions ADD CONSTRAINT fk_questions_category FOREIGN KEY (category) '
+               'REFERENCES categories (id) ON UPDATE CASCADE ON DELETE SET NULL NOT VALID')
+    with op.get_context().autocommit_block():
+        op.execute('ALTER TABLE questions VALIDATE CONSTRAINT fk_questions_category')
+        op.create_index('ix_questions_category_id', 'questions', ['category', 'id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.drop_index('ix_questions_category_id')
+            batch_op.drop_constraint('fk_questions_category', type_='foreignkey')
+            batch_op.alter_column('category', type_=sa.String(), existing_type=sa.Integer())
+        return
+
+    op.drop_index('ix_questions_category_id', table_name='questions')
+    op.drop_constraint('fk_questions_category', 'questions', type_='foreignkey')
+    op.alter_column('questions', 'category', type_=sa.String(), existing_type=sa.Integer(),
+                    postgresql_using='category::varchar')
@@ -1,28 +1,173 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
-import json
-from flask_migrate import Migrate
+import time
+import weakref
+from contextlib import contextmanager
+import click
+from flask import g, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine, orm
+from sqlalchemy.sql.expression import UpdateBase
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 
 database_username = os.environ.get('DB_USERNAME')
 database_password = os.environ.get('DB_PASSWORD')
 database_name = 'trivia'
-database_path = 'postgresql://{}:{}@{}/{}'.format(database_username, database_password, 'localhost:5432', database_name)
+database_path = os.environ.get('DATABASE_URL') or 'postgresql://{}:{}@{}/{}'.format(database_username, database_password, 'localhost:5432', database_name)
 
-db = SQLAlchemy()
+REPLICA_BIND_PREFIX = 'replica_'
+POOL_OPTIONS = (
+    ('DB_POOL_SIZE', 'pool_size', int),
+    ('DB_MAX_OVERFLOW', 'max_overflow', int),
+    ('DB_POOL_TIMEOUT', 'pool_timeout', int),
+    ('DB_POOL_RECYCLE', 'pool_recycle', int),
+    ('DB_POOL_PRE_PING', 'pool_pre_ping', lambda value: str(value).lower() in ('1', 'true', 'yes')),
+)
+
+"""
+read/write routing
+    queries go to the replica named by g.db_replica (a bind key, set per
+    request by flaskr.routing) and everything else to the primary. a flush
+    or a core insert/update/delete clears g.db_replica, so once a request
+    has written it reads its own writes from the primary
+"""
+def replica_binds(app):
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith(REPLICA_BIND_PREFIX))
+
+@contextmanager
+def primary_reads():
+    """
+    reads from the primary inside the block, for data cached past the request
+    """
+    replica = g.pop('db_replica', None) if has_app_context() else None
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.db_replica = replica
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if not has_app_context():
+            return super().get_bind(mapper, clause)
+        if self._flushing or isinstance(clause, UpdateBase):
+            g.pop('db_replica', None)
+            g.db_wrote = True
+        elif g.get('db_replica') is not None:
+            g.db_replica_read = True
+            return db.get_engine(self.app, bind=g.db_replica)
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+db = RoutingSQLAlchemy()
+
+"""
+data versions
+    per-table change counters bumped by the model insert/update/delete helpers.
+    in-process caches compare against them to know when to reload
+"""
+data_versions = {}
+data_changed_at = {}
+change_listeners = []
+started_at = time.time()
+
+def bump_data_version(table):
+    data_versions[table] = data_versions.get(table, 0) + 1
+    data_changed_at[table] = time.time()
+
+def data_version(table):
+    return data_versions.get(table, 0)
+
+def data_last_changed(table):
+    return data_changed_at.get(table, started_at)
+
+"""
+add_change_listener(listener)
+    registers a bound method called as listener(table, action, record) after
+    every committed model change, `record` being the format() of the row.
+    listeners are held weakly so they go away with their owner
+"""
+def add_change_listener(listener):
+    change_listeners.append(weakref.WeakMethod(listener))
+
+def record_change(table, action, record):
+    bump_data_version(table)
+    for listener_ref in list(change_listeners):
+        listener = listener_ref()
+        if listener is None:
+            change_listeners.remove(listener_ref)
+        else:
+            listener(table, action, record)
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. with `lazy` set
+    nothing touches the database until the first query: the tables are left
+    to `flask create-schema` / `flask db upgrade`, and Flask-Migrate (slow to
+    import) is only set up when the app is loaded by the flask command
 """
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, lazy=False):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+    replicas = app.config.get('DATABASE_REPLICA_URLS', os.environ.get('DATABASE_REPLICA_URLS'))
+    if isinstance(replicas, str):
+        replicas = [url.strip() for url in replicas.split(',') if url.strip()]
+    if replicas:
+        app.config["SQLALCHEMY_BINDS"] = dict(app.config.get("SQLALCHEMY_BINDS") or {}, **{
+            f'{REPLICA_BIND_PREFIX}{number}': url for number, url in enumerate(replicas)})
     app.secret_key = os.environ.get('SECRET_KEY')
     db.app = app
     db.init_app(app)
+    if not lazy:
+        db.create_all()
+    if not lazy or click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        migrate = Migrate(app, db)
+    app.cli.add_command(create_schema_command)
+    forked_apps.add(app)
+
+
+"""
+engine_options(config)
+    SQLALCHEMY_ENGINE_OPTIONS with the pool settings of the DB_POOL_SIZE,
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and DB_POOL_PRE_PING
+    config keys or environment variables. unset ones keep the driver default
+"""
+def engine_options(config):
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    for key, option, convert in POOL_OPTIONS:
+        value = config.get(key, os.environ.get(key))
+        if value is not None:
+            options[option] = convert(value)
+    return options
+
+
+@click.command('create-schema')
+@with_appcontext
+def create_schema_command():
+    """Create the missing tables (`flask db upgrade` applies the migrations)."""
     db.create_all()
-    migrate = Migrate(app, db)
+    click.echo('schema created')
+
+
+"""
+fork safety
+    connections pooled before a fork (gunicorn --preload loads the app in
+    the master) belong to the parent. each child starts with an empty pool
+    and leaves the parent's connections open for it
+"""
+forked_apps = weakref.WeakSet()
+
+def dispose_engines_after_fork():
+    for app in list(forked_apps):
+        for bind in [None] + replica_binds(app):
+            db.get_engine(app, bind=bind).dispose(close=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dispose_engines_after_fork)
 
 
 
@@ -36,9 +181,14 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id', name='fk_questions_category', onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
 
+    # also serves lookups on category alone, and keyset pages within a category
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
+
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
@@ -47,14 +197,21 @@ class Question(db.Model):
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        record = self.format()
         db.session.commit()
+        record_change(self.__tablename__, 'insert', record)
 
     def update(self):
+        record = self.format()
         db.session.commit()
+        record_change(self.__tablename__, 'update', record)
 
     def delete(self):
+        record = self.format()
         db.session.delete(self)
         db.session.commit()
+        record_change(self.__tablename__, 'delete', record)
 
     def format(self):
         return {
@@ -80,14 +237,21 @@ class Category(db.Model):
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        record = self.format()
         db.session.commit()
+        record_change(self.__tablename__, 'insert', record)
 
     def update(self):
+        record = self.format()
         db.session.commit()
+        record_change(self.__tablename__, 'update', record)
 
     def delete(self):
+        record = self.format()
         db.session.delete(self)
         db.session.commit()
+        record_change(self.__tablename__, 'delete', record)
 
     def format(self):
         return {
@@ -105,21 +269,44 @@ class Player(db.Model):
     name = Column(String)
     score = Column(Integer)
 
+    __table_args__ = (
+        Index('ix_players_score', score.desc()),
+    )
+
     def __init__(self, name, score):
         self.name = name
         self.score = score
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        record = self.format()
         db.session.commit()
+        record_change(self.__tablename__, 'insert', record)
+
+    @classmethod
+    def insert_many(cls, players):
+        try:
+            db.session.add_all(players)
+            db.session.flush()
+            records = [player.format() for player in players]
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+        for record in records:
+            record_change(cls.__tablename__, 'insert', record)
 
     def delete(self):
+        record = self.format()
         db.session.delete(self)
         db.session.commit()
+        record_change(self.__tablename__, 'delete', record)
 
     def format(self):
         return {
             'id': self.id,
-            'type': self.type
+            'name': self.name,
+            'score': self.score
             }
 
@@ -1,10 +1,125 @@
+import csv
 import os
+import re
+import shutil
+import sqlite3
+import tempfile
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from contextlib import contextmanager
+from flask import jsonify
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import StaticPool
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, QUESTIONS_PER_PAGE
+from flaskr import serialization
+from flaskr.response_cache import MemoryCacheBackend, SQLiteCacheBackend, ResponseCache
+from flaskr.rooms import Room, Subscriber, sse_message
+from flaskr.score_writer import ScoreWriter
+from flaskr.search import TrigramIndex
+from models import db, Question, Category, Player, data_version, dispose_engines_after_fork, engine_options
+
+SEED_DUMP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')
+COPY_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+
+seeded_connection = None
+
+
+def read_copy_blocks(path):
+    """
+    yields (table, columns, rows) for every COPY ... FROM stdin block of a
+    pg_dump file, \\N values as None
+    """
+    with open(path) as dump:
+        lines = iter(dump)
+        for line in lines:
+            match = re.match(r'COPY public\.(\w+) \(([^)]*)\) FROM stdin;', line)
+            if match is None:
+                continue
+            rows = []
+            for row in lines:
+                row = row.rstrip('\n')
+                if row == '\\.':
+                    break
+                rows.append([None if value == '\\N' else re.sub(r'\\(.)', lambda escape: COPY_ESCAPES.get(escape.group(1), escape.group(1)), value)
+                             for value in row.split('\t')])
+            yield match.group(1), match.group(2).split(', '), rows
+
+
+def shared_test_connection():
+    """
+    the in-memory SQLite database of the test run. the schema is created and
+    seeded from trivia.psql on first use, and the engine of every test app
+    wraps this one connection
+    """
+    global seeded_connection
+    if seeded_connection is None:
+        #autocommit at the driver level, transactions are begun explicitly (see begin_transaction)
+        connection = sqlite3.connect(':memory:', isolation_level=None, check_same_thread=False)
+        db.metadata.create_all(create_engine('sqlite://', creator=lambda: connection, poolclass=StaticPool))
+        connection.execute('BEGIN')
+        for table, columns, rows in read_copy_blocks(SEED_DUMP_PATH):
+            connection.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows)
+        connection.execute('COMMIT')
+        seeded_connection = connection
+    return seeded_connection
+
+
+def harness_config():
+    connection = shared_test_connection()
+    return {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_ENGINE_OPTIONS': {'creator': lambda: connection, 'poolclass': StaticPool},
+        'LAZY_STARTUP': True,
+    }
+
+
+def run_index_check(app, name):
+    """
+    runs the background check of one of the app's indexes as if its ttl had
+    passed, and waits for it
+    """
+    index = app.extensions['trivia_indexes'][name]
+    index._checked_at = float('-inf')
+    with app.app_context():
+        index.ensure_current()
+    index._refresh_thread.join()
+
+
+def begin_transaction(conn):
+    #pysqlite's own transaction handling does not support SAVEPOINT
+    conn.exec_driver_sql('BEGIN')
+
+
+class SQLCapture:
+    """
+    SQLCapture
+        records the SQL statements the app issues and the rows its ORM
+        queries fetch (from the app metrics) while the block runs
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.statements = []
+        self.rows = 0
+
+    def rows_fetched(self):
+        return sum(self.app.extensions['trivia_metrics'].sql_rows.values.values())
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        #savepoints come from the test transaction, not from the app
+        if 'SAVEPOINT' not in statement:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self.engine = db.get_engine(self.app)
+        event.listen(self.engine, 'before_cursor_execute', self.before_execute)
+        self._rows_before = self.rows_fetched()
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self.before_execute)
+        self.rows = self.rows_fetched() - self._rows_before
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,32 +127,58 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
+        self.app = create_app(harness_config())
         self.client = self.app.test_client
-        self.app.secret_key = os.environ.get('SECRET_KEY')
-        self.username = 'student'
-        self.password = 'student'
-        self.database_name = "trivia_test"
-        self.database_path = "postgresql://{}:{}@{}/{}".format(self.username, self.password, 'localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        self.app.secret_key = os.environ.get('SECRET_KEY', 'trivia-test')
+
+        # every test runs in a transaction rolled back afterwards, the app's
+        # commits and rollbacks only reach a savepoint inside it
+        engine = db.get_engine(self.app)
+        event.listen(engine, 'begin', begin_transaction)
+        self.connection = engine.connect()
+        self.transaction = self.connection.begin()
+        self.savepoint = self.connection.begin_nested()
+        self.app_session = db.session
+        db.session = db.create_scoped_session({'bind': self.connection, 'binds': {}})
+        event.listen(db.session, 'after_transaction_end', self.restart_savepoint)
+        self.addCleanup(self.rollback)
 
         # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-    
-    def tearDown(self):
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+
+    def restart_savepoint(self, session, transaction):
+        if not self.savepoint.is_active:
+            self.savepoint = self.connection.begin_nested()
+
+    def rollback(self):
         """Executed after reach test"""
-        pass
+        db.session.remove()
+        db.session = self.app_session
+        self.transaction.rollback()
+        self.connection.close()
+
+    @contextmanager
+    def sql_budget(self, statements, rows=None):
+        """
+        fails the test when the block issues more than `statements` SQL
+        statements or fetches more than `rows` rows
+        """
+        with SQLCapture(self.app) as capture:
+            yield capture
+        self.assertLessEqual(len(capture.statements), statements,
+                             'SQL statement budget exceeded:\n' + '\n'.join(capture.statements))
+        if rows is not None:
+            self.assertLessEqual(capture.rows, rows, 'row budget exceeded')
 
     """
     TODO
     Write at least one test for each test for successful operation and for expected errors.
     """
     def test_get_categories(self):
-        res = self.client().get("/api/categories")
+        with self.sql_budget(statements=1):
+            res = self.client().get("/api/categories")
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 200)
@@ -50,7 +191,8 @@ class TriviaTestCase(unittest.TestCase):
                     'type': 'Football',
                 }
 
-        res = self.client().post("/api/categories", json=new_category)
+        with self.sql_budget(statements=1, rows=0):
+            res = self.client().post("/api/categories", json=new_category)
         data = json.loads(res.data)
 
         saved_category = Category.query.filter_by(type=new_category['type']).first()
@@ -60,8 +202,27 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(new_category['type'], saved_category.type)
 
 
+    def test_categories_served_from_registry(self):
+        self.client().get("/api/categories")
+        with self.sql_budget(statements=0):
+            res = self.client().get("/api/categories")
+
+        self.assertEqual(res.status_code, 200)
+
+
+    def test_created_category_listed_immediately(self):
+        self.client().get("/api/categories")
+        res = self.client().post("/api/categories", json={'type': 'Chess'})
+        self.assertEqual(res.status_code, 200)
+
+        with self.sql_budget(statements=1):
+            data = json.loads(self.client().get("/api/categories").data)
+        self.assertIn('Chess', data["categories"].values())
+
+
     def test_405_for_categories(self):
-        res = self.client().patch("/api/categories")
+        with self.sql_budget(statements=0):
+            res = self.client().patch("/api/categories")
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 405)
@@ -70,7 +231,10 @@ class TriviaTestCase(unittest.TestCase):
 
 
     def test_get_questions(self):
-        res = self.client().get("/api/questions")
+        #the category map is loaded once per worker, then the page is one COUNT and 10 rows
+        self.client().get("/api/categories")
+        with self.sql_budget(statements=2, rows=QUESTIONS_PER_PAGE + 1):
+            res = self.client().get("/api/questions")
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 200)
@@ -80,8 +244,121 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data["questions"]))
 
 
+    def test_read_endpoints_do_not_set_cookies(self):
+        for path in ("/api/categories", "/api/questions", "/api/categories/3/questions"):
+            with self.sql_budget(statements=2, rows=QUESTIONS_PER_PAGE + 1):
+                res = self.client().get(path)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn("Set-Cookie", res.headers)
+
+
+    def test_get_questions_scoped_to_category(self):
+        with self.sql_budget(statements=3):
+            res = self.client().get("/api/questions?category=3")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["current_category"], 3)
+        self.assertTrue(data["questions"])
+        self.assertTrue(all(question["category"] == 3 for question in data["questions"]))
+
+
+    def test_get_questions_not_modified_for_matching_etag(self):
+        res = self.client().get("/api/questions")
+        etag = res.headers["ETag"]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("public", res.headers["Cache-Control"])
+        self.assertIn("Last-Modified", res.headers)
+
+        with self.sql_budget(statements=0):
+            res = self.client().get("/api/questions", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+
+    def test_etag_changes_after_write(self):
+        etag = self.client().get("/api/categories").headers["ETag"]
+        self.client().post("/api/categories", json={'type': 'Etag'})
+
+        with self.sql_budget(statements=1):
+            res = self.client().get("/api/categories", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers["ETag"], etag)
+
+
+    def test_get_questions_skips_orm_hydration(self):
+        loaded_ids = []
+        def on_load(target, context):
+            loaded_ids.append(target.id)
+
+        self.client().get("/api/categories")
+        event.listen(Question, 'load', on_load)
+        try:
+            with self.sql_budget(statements=2, rows=QUESTIONS_PER_PAGE + 1):
+                res = self.client().get("/api/questions?page=1")
+        finally:
+            event.remove(Question, 'load', on_load)
+        data = json.loads(res.data)
+        returned_ids = [question["id"] for question in data["questions"]]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(loaded_ids, [])
+        self.assertLessEqual(len(returned_ids), QUESTIONS_PER_PAGE)
+        self.assertEqual(returned_ids, sorted(returned_ids))
+        self.assertGreaterEqual(data["total_questions"], len(data["questions"]))
+
+
+    def test_projection_response_matches_jsonify(self):
+        with self.sql_budget(statements=2):
+            res = self.client().get("/api/categories/2/questions")
+
+        with self.app.app_context():
+            questions = Question.query.filter_by(category=2).order_by(Question.id).all()
+            expected = jsonify({
+                'success': True,
+                'questions': [question.format() for question in questions],
+                'total_questions': len(questions),
+                'current_category': 'Art'
+            }).get_data()
+
+        self.assertEqual(res.data, expected)
+
+
+    def test_listing_bytes_match_jsonify_with_many_categories(self):
+        for number in range(10):
+            Category(type=f'Catégorie {number}').insert()
+        Question(question='Qui a peint « Guernica » ?', answer='Picasso', category=1, difficulty=2).insert()
+        res = self.client().get("/api/questions?page=1")
+
+        with self.app.app_context():
+            categories = {category.id: category.type for category in Category.query.all()}
+            questions = Question.query.order_by(Question.id).limit(QUESTIONS_PER_PAGE).all()
+            expected = jsonify({
+                'success': True,
+                'questions': [question.format() for question in questions],
+                'total_questions': Question.query.count(),
+                'current_category': 0,
+                'categories': categories
+            }).get_data()
+
+        self.assertGreaterEqual(len(categories), 10)
+        self.assertEqual(res.data, expected)
+
+
+    @unittest.skipIf(serialization.orjson is None, 'orjson is not installed')
+    def test_orjson_responses_are_opt_in(self):
+        payload = {'categories': {2: 'Art', 10: 'Café'}}
+        self.assertEqual(serialization.dumps(payload), jsonify(payload).get_data(as_text=True))
+
+        self.app.config['ORJSON_RESPONSES'] = True
+        self.assertEqual(json.loads(serialization.dumps(payload)), json.loads(jsonify(payload).get_data()))
+
+
     def test_404_request_beyond_valid_questions_page(self):
-        res = self.client().get("/api/questions?page=500")
+        with self.sql_budget(statements=3):
+            res = self.client().get("/api/questions?page=500")
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 404)
@@ -89,8 +366,48 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["message"], "page not found")
 
 
+    def test_get_questions_keyset_walk(self):
+        total = json.loads(self.client().get("/api/questions").data)["total_questions"]
+        seen_ids = []
+        cursor = 0
+        while cursor is not None:
+            with self.sql_budget(statements=1, rows=8):
+                res = self.client().get(f"/api/questions?after_id={cursor}&limit=7")
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertLessEqual(len(data["questions"]), 7)
+            seen_ids.extend(question["id"] for question in data["questions"])
+            cursor = data["next_cursor"]
+
+        self.assertEqual(seen_ids, sorted(set(seen_ids)))
+        self.assertEqual(len(seen_ids), total)
+
+
+    def test_get_category_questions_keyset_page(self):
+        with self.sql_budget(statements=2):
+            res = self.client().get("/api/categories/2/questions?after_id=0&limit=2")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data["questions"]), 2)
+        self.assertTrue(all(question["category"] == 2 for question in data["questions"]))
+        self.assertEqual(data["next_cursor"], data["questions"][-1]["id"])
+
+
+    def test_400_keyset_invalid_limit(self):
+        with self.sql_budget(statements=0):
+            res = self.client().get("/api/questions?after_id=0&limit=0")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "bad request")
+
+
     def test_get_questions_search_with_results(self):
-        res = self.client().post("/api/questions", json={"searchTerm": "lake"})
+        with self.sql_budget(statements=2):
+            res = self.client().post("/api/questions", json={"searchTerm": "lake"})
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 200)
@@ -99,8 +416,71 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["total_questions"])
         
 
+    def test_search_matches_word_prefix(self):
+        with self.sql_budget(statements=2):
+            res = self.client().post("/api/questions", json={"searchTerm": "penicil"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["total_questions"], 1)
+        self.assertEqual(data["questions"][0]["answer"], "Alexander Fleming")
+
+
+    def test_search_results_are_paginated(self):
+        first_page = json.loads(self.client().post("/api/questions", json={"searchTerm": "the"}).data)
+        with self.sql_budget(statements=1, rows=QUESTIONS_PER_PAGE):
+            second_page = json.loads(self.client().post("/api/questions", json={"searchTerm": "the", "page": 2}).data)
+
+        self.assertGreater(first_page["total_questions"], len(first_page["questions"]))
+        self.assertEqual(len(first_page["questions"]), 10)
+        self.assertEqual(first_page["total_questions"], len(first_page["questions"]) + len(second_page["questions"]))
+        first_ids = {question["id"] for question in first_page["questions"]}
+        self.assertFalse(first_ids & {question["id"] for question in second_page["questions"]})
+
+
+    def test_fuzzy_search_tolerates_typos(self):
+        with self.sql_budget(statements=2):
+            res = self.client().post("/api/questions", json={"searchTerm": "penicilin", "fuzzy": True})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["questions"][0]["answer"], "Alexander Fleming")
+
+
+    def test_fuzzy_search_sees_new_questions(self):
+        self.client().post("/api/questions", json={"searchTerm": "xylophone", "fuzzy": True})
+        new_question = {'question': 'Which instrument is a xylophone?', 'answer': 'Percussion', 'difficulty': 1, 'category': 2}
+        self.client().post("/api/questions", json=new_question)
+
+        with self.sql_budget(statements=1, rows=QUESTIONS_PER_PAGE):
+            data = json.loads(self.client().post("/api/questions", json={"searchTerm": "xylofone", "fuzzy": True}).data)
+        self.assertIn(new_question['question'], [question["question"] for question in data["questions"]])
+
+
+    def test_fuzzy_candidates_fully_counted_past_the_cap(self):
+        index = TrigramIndex(threshold=0.5, max_candidates=1)
+        rows = [{'id': 1, 'question': 'river', 'category': 1}, {'id': 2, 'question': 'rover', 'category': 1}]
+        index._swap(index.build(rows), data_version(Question.__tablename__), None)
+
+        #the rarest trigrams admit question 1, the shared ones are still counted for it
+        self.assertEqual(index.top('river'), [1])
+        self.assertEqual(index.top('rover'), [2])
+
+
+    def test_search_scoped_to_category(self):
+        with self.sql_budget(statements=2):
+            res = self.client().post("/api/questions", json={"searchTerm": "what", "category": 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["current_category"], 1)
+        self.assertTrue(data["questions"])
+        self.assertTrue(all(question["category"] == 1 for question in data["questions"]))
+
+
     def test_get_book_search_without_results(self):
-        res = self.client().post("/api/questions", json={"searchTerm": "zed za"})
+        with self.sql_budget(statements=1):
+            res = self.client().post("/api/questions", json={"searchTerm": "zed za"})
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 200)
@@ -117,7 +497,8 @@ class TriviaTestCase(unittest.TestCase):
                     'category': '2'
                 }
 
-        res = self.client().post("/api/questions", json=new_question)
+        with self.sql_budget(statements=3):
+            res = self.client().post("/api/questions", json=new_question)
         data = json.loads(res.data)
 
         saved_question = Question.query.filter_by(question=new_question['question']).first()
@@ -127,12 +508,105 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(new_question['answer'], saved_question.answer)
 
 
+    def test_bulk_import_reports_bad_rows(self):
+        rows = [
+            {'question': 'Bulk question one?', 'answer': 'One', 'category': 1, 'difficulty': 1},
+            {'question': 'Bulk question two?', 'answer': 'Two', 'category': 99, 'difficulty': 1},
+            {'question': 'Bulk question three?', 'answer': 'Three', 'category': '3', 'difficulty': 2},
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+
+        with self.sql_budget(statements=3):
+            res = self.client().post("/api/questions/import?batch_size=2", data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["inserted"], 2)
+        self.assertEqual(data["failed"], 2)
+        self.assertEqual(data["batches"], 2)
+        self.assertEqual([error["line"] for error in data["errors"]], [2, 4])
+        self.assertIsNotNone(Question.query.filter_by(question='Bulk question three?').first())
+
+
+    def test_bulk_import_csv(self):
+        body = 'question,answer,category,difficulty\nBulk csv question?,Csv,2,3\n'
+
+        with self.sql_budget(statements=2):
+            res = self.client().post("/api/questions/import", data=body, content_type='text/csv')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(data["errors"], [])
+
+
+    def test_bulk_import_rejects_booleans_and_fractions(self):
+        rows = [
+            {'question': 'Bulk boolean?', 'answer': 'One', 'category': True, 'difficulty': 1},
+            {'question': 'Bulk fraction?', 'answer': 'Two', 'category': 1, 'difficulty': 2.9},
+            {'question': 'Bulk whole float?', 'answer': 'Three', 'category': 1, 'difficulty': 2.0},
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\n'
+        data = json.loads(self.client().post("/api/questions/import", data=body, content_type='application/x-ndjson').data)
+
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual([error["line"] for error in data["errors"]], [1, 2])
+
+
+    def test_bulk_import_csv_reports_unparsable_rows(self):
+        body = ('question,answer,category,difficulty\n'
+                f'Bulk long csv question?,{"x" * (csv.field_size_limit() + 1)},2,3\n'
+                'Bulk csv question?,Csv,2,3\n')
+        res = self.client().post("/api/questions/import", data=body, content_type='text/csv')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual([error["line"] for error in data["errors"]], [2])
+
+
+    def test_export_questions_as_ndjson(self):
+        with self.sql_budget(statements=1):
+            res = self.client().get("/api/questions/export?category=3")
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertTrue(rows)
+        self.assertTrue(all(row["category"] == 3 for row in rows))
+        self.assertEqual([row["id"] for row in rows], sorted(row["id"] for row in rows))
+        self.assertEqual(set(rows[0]), {'id', 'question', 'answer', 'category', 'difficulty'})
+
+
+    def test_400_export_invalid_filter(self):
+        with self.sql_budget(statements=0):
+            res = self.client().get("/api/questions/export?difficulty=hard")
+
+        self.assertEqual(res.status_code, 400)
+
+
     def test_422_if_question_creation_fails(self):
         new_question = {
             'good question': 'What is the first alphabet?',
             'not answered': 'A'
          }
-        res = self.client().post("/api/questions", json=new_question)
+        with self.sql_budget(statements=0):
+            res = self.client().post("/api/questions", json=new_question)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'unprocessable entity')
+
+
+    def test_422_if_question_category_does_not_exist(self):
+        new_question = {
+            'question': 'Which category is this?',
+            'answer': 'None',
+            'difficulty': 1,
+            'category': 99
+        }
+        with self.sql_budget(statements=1):
+            res = self.client().post("/api/questions", json=new_question)
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 422)
@@ -140,7 +614,8 @@ class TriviaTestCase(unittest.TestCase):
 
 
     def test_405_for_failed_create_question(self):
-        res = self.client().patch("/api/questions", json={'question': 'will this request fail?'})
+        with self.sql_budget(statements=0):
+            res = self.client().patch("/api/questions", json={'question': 'will this request fail?'})
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 405)
@@ -149,7 +624,8 @@ class TriviaTestCase(unittest.TestCase):
 
 
     def test_delete_question(self):
-        res = self.client().delete('/api/questions/6')
+        with self.sql_budget(statements=2, rows=1):
+            res = self.client().delete('/api/questions/6')
         data = json.loads(res.data)
 
         question = Question.query.filter(Question.id == 6).one_or_none()
@@ -160,7 +636,8 @@ class TriviaTestCase(unittest.TestCase):
 
 
     def test_404_on_delete_question_does_not_exist(self):
-        res = self.client().delete("/api/questions/10000000")
+        with self.sql_budget(statements=1, rows=0):
+            res = self.client().delete("/api/questions/10000000")
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 404)
@@ -169,7 +646,8 @@ class TriviaTestCase(unittest.TestCase):
 
 
     def test_404_if_category_does_not_exist(self):
-        res = self.client().get("/api/categories/99/questions")
+        with self.sql_budget(statements=1):
+            res = self.client().get("/api/categories/99/questions")
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 404)
@@ -183,7 +661,9 @@ class TriviaTestCase(unittest.TestCase):
                     "quiz_category" : {"id": 44, "type": ""}
                 }
 
-        res = self.client().post("/api/quizzes", json=params)
+        #the question id index is built by the first quiz request
+        with self.sql_budget(statements=1):
+            res = self.client().post("/api/quizzes", json=params)
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 404)
@@ -191,13 +671,163 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["message"], "no questions or category does not exist")
 
     
+    def test_quiz_serves_unseen_questions_then_ends(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 1, "type": "Science"}}
+        self.client().post("/api/quizzes", json=params)
+
+        while True:
+            with self.sql_budget(statements=1, rows=1):
+                res = self.client().post("/api/quizzes", json=params)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if "question" not in data:
+                break
+            self.assertEqual(data["question"]["category"], 1)
+            self.assertNotIn(data["question"]["id"], params["previous_questions"])
+            params["previous_questions"].append(data["question"]["id"])
+
+        self.assertEqual(len(params["previous_questions"]), Question.query.filter_by(category=1).count())
+
+
+    def test_quiz_batch_serves_distinct_unseen_questions_then_ends(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 1, "type": "Science"}, "count": 2,
+                  "player_name": "Ada", "final_score": 3}
+        self.client().post("/api/quizzes", json={"previous_questions": [], "quiz_category": {"id": 1}})
+        total = Question.query.filter_by(category=1).count()
+
+        while len(params["previous_questions"]) < total:
+            with self.sql_budget(statements=1, rows=2):
+                res = self.client().post("/api/quizzes", json=params)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            ids = [question["id"] for question in data["questions"]]
+            self.assertEqual(len(ids), min(2, total - len(params["previous_questions"])))
+            self.assertEqual(len(set(ids) | set(params["previous_questions"])), len(ids) + len(params["previous_questions"]))
+            params["previous_questions"].extend(ids)
+
+        data = json.loads(self.client().post("/api/quizzes", json=params).data)
+        self.assertNotIn("questions", data)
+        self.assertEqual(Player.query.filter_by(name="Ada").count(), 1)
+
+
+    def test_422_quiz_invalid_count(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 1, "type": ""}, "count": 0}
+
+        with self.sql_budget(statements=0):
+            res = self.client().post("/api/quizzes", json=params)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(json.loads(res.data)["success"], False)
+
+
+    def test_quiz_index_follows_inserts_and_deletes(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 6, "type": "Sports"}}
+        self.client().post("/api/quizzes", json=params)
+        params["previous_questions"] = [question.id for question in Question.query.filter_by(category=6)]
+        added = Question(question='Which sport uses a shuttlecock?', answer='Badminton', category=6, difficulty=1)
+        added.insert()
+
+        with self.sql_budget(statements=1):
+            data = json.loads(self.client().post("/api/quizzes", json=params).data)
+        self.assertEqual(data["question"]["id"], added.id)
+
+        params["previous_questions"] = params["previous_questions"][1:]
+        Question.query.get(added.id).delete()
+        data = json.loads(self.client().post("/api/quizzes", json=params).data)
+        self.assertNotEqual(data["question"]["id"], added.id)
+
+
+    def test_quiz_draws_within_difficulty_range_and_weights(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 0, "type": ""},
+                  "difficulty": [2, 4], "category_weights": {"1": 0}}
+        expected = Question.query.filter(Question.difficulty.between(2, 4), Question.category != 1).count()
+        self.client().post("/api/quizzes", json=params)
+
+        while True:
+            with self.sql_budget(statements=1, rows=1):
+                data = json.loads(self.client().post("/api/quizzes", json=params).data)
+            if "question" not in data:
+                break
+            self.assertIn(data["question"]["difficulty"], (2, 3, 4))
+            self.assertNotEqual(data["question"]["category"], 1)
+            self.assertNotIn(data["question"]["id"], params["previous_questions"])
+            params["previous_questions"].append(data["question"]["id"])
+
+        self.assertEqual(len(params["previous_questions"]), expected)
+
+
+    def test_quiz_weights_follow_inserts(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 6, "type": "Sports"},
+                  "difficulty_weights": {"1": 1, "2": 0, "3": 0, "4": 0, "5": 0}}
+        self.client().post("/api/quizzes", json=params)
+        params["previous_questions"] = [question.id for question in Question.query.filter_by(category=6, difficulty=1)]
+        added = Question(question='Which sport uses a shuttlecock?', answer='Badminton', category=6, difficulty=1)
+        added.insert()
+
+        data = json.loads(self.client().post("/api/quizzes", json=params).data)
+        self.assertEqual(data["question"]["id"], added.id)
+
+
+    def test_422_quiz_invalid_difficulty(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 2, "type": ""}, "difficulty": [4, 1]}
+
+        with self.sql_budget(statements=0):
+            res = self.client().post("/api/quizzes", json=params)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(json.loads(res.data)["success"], False)
+
+
+    def test_quiz_index_expires_to_serve_writes_made_elsewhere(self):
+        app = create_app(harness_config())
+        params = {"previous_questions": [question.id for question in Question.query.filter_by(category=6)],
+                  "quiz_category": {"id": 6, "type": "Sports"}}
+        self.assertNotIn("question", app.test_client().post("/api/quizzes", json=params).get_json())
+
+        #another worker's write: no change notification reaches this one
+        db.session.execute(text("INSERT INTO questions (question, answer, category, difficulty) "
+                                "VALUES ('Which sport uses a shuttlecock?', 'Badminton', 6, 1)"))
+        db.session.commit()
+        run_index_check(app, 'questions')
+        data = app.test_client().post("/api/quizzes", json=params).get_json()
+        self.assertEqual(data["question"]["answer"], "Badminton")
+
+
+    def test_expired_quiz_index_kept_when_table_unchanged(self):
+        app = create_app(harness_config())
+        params = {"previous_questions": [], "quiz_category": {"id": 6, "type": "Sports"}}
+        app.test_client().post("/api/quizzes", json=params)
+
+        #this worker's own insert moves the signature it compares against
+        added = Question(question='Which sport uses a shuttlecock?', answer='Badminton', category=6, difficulty=1)
+        added.insert()
+
+        #the count and highest id are compared instead of reading every question again
+        with SQLCapture(app) as capture:
+            run_index_check(app, 'questions')
+        self.assertEqual(capture.rows, 1)
+
+
+    def test_quiz_skips_questions_deleted_elsewhere(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 6, "type": "Sports"}}
+        self.client().post("/api/quizzes", json=params)
+        ids = [question.id for question in Question.query.filter_by(category=6)]
+        params["previous_questions"] = ids[2:]
+        db.session.execute(text("DELETE FROM questions WHERE id = :id"), {"id": ids[0]})
+
+        for _ in range(5):
+            data = json.loads(self.client().post("/api/quizzes", json=params).data)
+            self.assertEqual(data["question"]["id"], ids[1])
+
+
     def test_422_quiz_invalid_previous_questions_type(self):
         params = {
                     "previous_questions" : "[]",
                     "quiz_category" : {"id": 2, "type": ""}
                 }
 
-        res = self.client().post("/api/quizzes", json=params)
+        with self.sql_budget(statements=0):
+            res = self.client().post("/api/quizzes", json=params)
         data = json.loads(res.data)
 
         self.assertEqual(res.status_code, 422)
@@ -205,8 +835,433 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["message"], "unprocessable entity")
 
 
+    def test_quiz_session_deals_each_question_once(self):
+        res = self.client().post("/api/quizzes/sessions", json={"quiz_category": {"id": 3, "type": "Geography"}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        session_id = data["session_id"]
+        total = data["total_questions"]
+
+        dealt_ids = []
+        for _ in range(total):
+            with self.sql_budget(statements=1, rows=1):
+                data = json.loads(self.client().post(f"/api/quizzes/sessions/{session_id}/next").data)
+            self.assertEqual(data["question"]["category"], 3)
+            dealt_ids.append(data["question"]["id"])
+        self.assertEqual(len(set(dealt_ids)), total)
+
+        res = self.client().post(f"/api/quizzes/sessions/{session_id}/next")
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertNotIn("question", data)
+
+
+    def test_quiz_session_shared_between_workers(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        config = dict(harness_config(), QUIZ_SESSION_STORE='sqlite', QUIZ_SESSION_PATH=os.path.join(folder, 'sessions.db'))
+        #two apps on one file stand for two gunicorn workers
+        workers = [create_app(config).test_client(), create_app(config).test_client()]
+        data = workers[0].post("/api/quizzes/sessions", json={"quiz_category": {"id": 3}}).get_json()
+
+        dealt_ids = [workers[number % 2].post(f"/api/quizzes/sessions/{data['session_id']}/next").get_json()["question"]["id"]
+                     for number in range(data["total_questions"])]
+        self.assertEqual(len(set(dealt_ids)), data["total_questions"])
+        self.assertNotIn("question", workers[1].post(f"/api/quizzes/sessions/{data['session_id']}/next").get_json())
+        self.assertEqual(workers[0].post(f"/api/quizzes/sessions/{data['session_id']}/next").status_code, 404)
+
+
+    def test_404_quiz_session_does_not_exist(self):
+        with self.sql_budget(statements=0):
+            res = self.client().post("/api/quizzes/sessions/not-a-session/next")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "quiz session not found")
+
+
+    def test_400_quiz_session_category_not_a_number(self):
+        with self.sql_budget(statements=0):
+            res = self.client().post("/api/quizzes/sessions", json={"quiz_category": {"id": "science"}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["success"], False)
+
+
+    def test_leaderboard_orders_players_by_score(self):
+        self.client().get("/api/leaderboard")
+        low = Player(name='Low scorer', score=-1)
+        low.insert()
+        high = Player(name='High scorer', score=1000000)
+        high.insert()
+
+        with self.sql_budget(statements=0):
+            data = json.loads(self.client().get("/api/leaderboard?limit=5").data)
+        scores = [player["score"] for player in data["players"]]
+
+        self.assertEqual(data["players"][0]["name"], 'High scorer')
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        data = json.loads(self.client().get(f"/api/leaderboard/players/{low.id}").data)
+        self.assertEqual(data["rank"], data["total_players"])
+        data = json.loads(self.client().get(f"/api/leaderboard/players/{high.id}").data)
+        self.assertEqual(data["rank"], 1)
+        self.assertEqual(data["player"]["name"], 'High scorer')
+
+
+    def test_leaderboard_expires_to_show_scores_saved_elsewhere(self):
+        app = create_app(harness_config())
+        total = app.test_client().get("/api/leaderboard").get_json()["total_players"]
+
+        #another worker's write: no change notification reaches this one
+        db.session.execute(text("INSERT INTO players (name, score) VALUES ('Elsewhere', 99999999)"))
+        db.session.commit()
+        run_index_check(app, 'players')
+        data = app.test_client().get("/api/leaderboard").get_json()
+        self.assertEqual(data["total_players"], total + 1)
+        self.assertEqual(data["players"][0]["name"], "Elsewhere")
+
+
+    def test_leaderboard_reads_only_scores_saved_elsewhere(self):
+        app = create_app(harness_config())
+        with app.app_context():
+            Player.insert_many([Player(name=f'Player {number}', score=number) for number in range(10)])
+        app.test_client().get("/api/leaderboard")
+
+        db.session.execute(text("INSERT INTO players (name, score) VALUES ('Elsewhere', 5)"))
+        db.session.commit()
+        #the signature row and the new player, not the whole table
+        with SQLCapture(app) as capture:
+            run_index_check(app, 'players')
+        self.assertEqual(capture.rows, 2)
+
+        data = app.test_client().get("/api/leaderboard").get_json()
+        self.assertEqual(data["total_players"], 11)
+        self.assertEqual([player["score"] for player in data["players"]], [9, 8, 7, 6, 5, 5, 4, 3, 2, 1])
+        self.assertEqual(data["players"][5]["name"], "Elsewhere")
+
+
+    def test_422_quiz_final_score_not_an_integer(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 1, "type": ""},
+                  "player_name": "Ada", "final_score": "abc"}
+        res = self.client().post("/api/quizzes", json=params)
+        self.assertEqual(res.status_code, 422)
+
+        session_id = self.client().post("/api/quizzes/sessions", json={"quiz_category": {"id": 1}}).get_json()["session_id"]
+        res = self.client().post(f"/api/quizzes/sessions/{session_id}/next", json={"player_name": "Ada", "final_score": 1.5})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Player.query.filter_by(name="Ada").count(), 0)
+
+
+    def test_422_quiz_player_name_not_a_string(self):
+        params = {"previous_questions": [], "quiz_category": {"id": 1, "type": ""},
+                  "player_name": ["Ada"], "final_score": 3}
+        res = self.client().post("/api/quizzes", json=params)
+        self.assertEqual(res.status_code, 422)
+
+        session_id = self.client().post("/api/quizzes/sessions", json={"quiz_category": {"id": 1}}).get_json()["session_id"]
+        res = self.client().post(f"/api/quizzes/sessions/{session_id}/next", json={"player_name": {"name": "Ada"}, "final_score": 3})
+        self.assertEqual(res.status_code, 422)
+
+
+    def test_write_behind_scores_flushed_in_batches(self):
+        writer = ScoreWriter(self.app, synchronous=False, batch_size=2, flush_interval=0.05)
+        names = [f'Write behind {number}' for number in range(3)]
+        for name in names:
+            writer.record(name, 1)
+        with self.sql_budget(statements=len(names)):
+            writer.close()
+
+        players = Player.query.filter(Player.name.in_(names)).all()
+        self.assertEqual(sorted(player.name for player in players), names)
+
+
+    def test_write_behind_retries_a_failed_batch_one_score_at_a_time(self):
+        writer = ScoreWriter(self.app, synchronous=False)
+        self.assertRaises(ValueError, writer.record, 'Not a score', 'abc')
+        self.assertRaises(ValueError, writer.record, ['Not a name'], 1)
+
+        #a name the driver cannot bind fails the batch insert
+        with self.assertLogs(self.app.logger, 'ERROR'):
+            writer._flush([('Kept 1', 1), (object(), 2), ('Kept 2', 3)])
+
+        players = Player.query.filter(Player.name.in_(['Kept 1', 'Kept 2'])).all()
+        self.assertEqual(sorted(player.score for player in players), [1, 3])
 
 
+    def test_404_rank_of_unknown_player(self):
+        with self.sql_budget(statements=1, rows=0):
+            res = self.client().get("/api/leaderboard/players/10000000")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["message"], "player not found")
+
+
+    def test_metrics_exposes_request_and_sql_counters(self):
+        self.client().get("/api/questions")
+        with self.sql_budget(statements=0):
+            res = self.client().get("/metrics")
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith("text/plain"))
+        self.assertIn('trivia_http_request_duration_seconds_count{endpoint="all_questions",method="GET",status="200"} 1', body)
+        self.assertIn('trivia_sql_statements_total{endpoint="all_questions"}', body)
+        self.assertIn('trivia_sql_rows_fetched_total{endpoint="all_questions"}', body)
+        self.assertIn('trivia_db_pool_wait_seconds_count', body)
+
+
+    def test_lazy_startup_does_not_connect(self):
+        database_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'missing-folder', 'trivia.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}', 'LAZY_STARTUP': True})
+
+        self.assertNotIn('migrate', app.extensions)
+        self.assertFalse(os.path.exists(os.path.dirname(database_path)))
+
+
+    def test_create_schema_command(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'LAZY_STARTUP': True})
+        result = app.test_cli_runner().invoke(args=['create-schema'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue({'categories', 'questions', 'players'} <= set(inspect(db.get_engine(app)).get_table_names()))
+
+
+    def test_engine_gets_a_new_pool_after_fork(self):
+        pool = db.get_engine(self.app).pool
+        dispose_engines_after_fork()
+
+        self.assertIsNot(db.get_engine(self.app).pool, pool)
+
+
+    def test_pool_settings_from_config(self):
+        options = engine_options({'DB_POOL_SIZE': '20', 'DB_MAX_OVERFLOW': 5, 'DB_POOL_PRE_PING': 'true',
+                                  'SQLALCHEMY_ENGINE_OPTIONS': {'echo': False}})
+
+        self.assertEqual(options, {'echo': False, 'pool_size': 20, 'max_overflow': 5, 'pool_pre_ping': True})
+
+
+    def replica_app(self, **config):
+        """
+        an app on two SQLite files, the replica holding two questions of
+        category 1 the primary does not, which tell where a query was served from
+        """
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        primary_path, replica_path = os.path.join(folder, 'primary.db'), os.path.join(folder, 'replica.db')
+        for path in (primary_path, replica_path):
+            copy = sqlite3.connect(path)
+            shared_test_connection().backup(copy)
+            copy.close()
+        replica = sqlite3.connect(replica_path)
+        replica.executemany("INSERT INTO questions (question, answer, category, difficulty) VALUES (?, 'Yes', 1, 1)",
+                            [('Replica only one?',), ('Replica only two?',)])
+        replica.commit()
+        replica.close()
+
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary_path}',
+                          'DATABASE_REPLICA_URLS': [f'sqlite:///{replica_path}'], 'LAZY_STARTUP': True, **config})
+        harness_session, db.session = db.session, self.app_session
+        self.addCleanup(setattr, db, 'session', harness_session)
+        self.addCleanup(db.session.remove)
+        return app
+
+
+    def test_reads_go_to_replica_until_client_writes(self):
+        app = self.replica_app(RESPONSE_CACHE='none')
+        writer, reader = app.test_client(), app.test_client()
+        seeded_total = json.loads(writer.get("/api/questions").data)["total_questions"] - 2
+
+        res = writer.post("/api/questions", json={'question': 'Primary only?', 'answer': 'Yes', 'difficulty': 1, 'category': 1})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_primary=', res.headers["Set-Cookie"])
+
+        self.assertEqual(json.loads(writer.get("/api/questions").data)["total_questions"], seeded_total + 1)
+        res = reader.get("/api/questions")
+        self.assertEqual(json.loads(res.data)["total_questions"], seeded_total + 2)
+        #the replica lags behind the data version an ETag would name
+        self.assertNotIn('ETag', res.headers)
+
+
+    def test_cached_responses_read_from_primary(self):
+        app = self.replica_app(RESPONSE_CACHE='memory')
+        writer, reader = app.test_client(), app.test_client()
+        seeded_total = json.loads(writer.get("/api/categories/1/questions").data)["total_questions"]
+
+        res = writer.post("/api/questions", json={'question': 'Primary only?', 'answer': 'Yes', 'difficulty': 1, 'category': 1})
+        self.assertEqual(res.status_code, 200)
+
+        #the reader's miss fills the entry the writer is then served
+        res = reader.get("/api/categories/1/questions")
+        self.assertEqual(json.loads(res.data)["total_questions"], seeded_total + 1)
+        self.assertIn('ETag', res.headers)
+        self.assertEqual(json.loads(writer.get("/api/categories/1/questions").data)["total_questions"], seeded_total + 1)
+
+
+    def test_listing_served_from_response_cache(self):
+        first = self.client().get("/api/questions?page=2")
+        with self.sql_budget(statements=0):
+            second = self.client().get("/api/questions?page=2")
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.mimetype, 'application/json')
+        self.assertIn('trivia_response_cache_hits_total{endpoint="all_questions"} 1', self.client().get("/metrics").data.decode())
+
+
+    def test_response_cache_invalidated_by_writes(self):
+        total = json.loads(self.client().get("/api/categories/1/questions").data)["total_questions"]
+        self.client().post("/api/questions", json={'question': 'Cached?', 'answer': 'No', 'difficulty': 1, 'category': 1})
+
+        data = json.loads(self.client().get("/api/categories/1/questions").data)
+        self.assertEqual(data["total_questions"], total + 1)
+
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        backend = MemoryCacheBackend(max_bytes=10)
+        backend.set('a', 0, b'aaaa', 'application/json')
+        backend.set('b', 0, b'bbbb', 'application/json')
+        backend.get('a')
+        backend.set('c', 0, b'cccc', 'application/json')
+
+        self.assertIsNotNone(backend.get('a'))
+        self.assertIsNone(backend.get('b'))
+        self.assertIsNotNone(backend.get('c'))
+
+
+    def test_sqlite_response_cache_shared_between_apps(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        config = dict(harness_config(), RESPONSE_CACHE='sqlite', RESPONSE_CACHE_PATH=os.path.join(folder, 'cache.db'))
+        first_worker, second_worker = create_app(config), create_app(config)
+
+        first = first_worker.test_client().get("/api/categories/3/questions")
+        with SQLCapture(second_worker) as capture:
+            second = second_worker.test_client().get("/api/categories/3/questions")
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(capture.statements, [])
+
+        second_worker.test_client().post("/api/categories", json={'type': 'Shared'})
+        #the generation is in the file, so the write invalidates for every worker
+        backend = SQLiteCacheBackend(config['RESPONSE_CACHE_PATH'])
+        self.assertGreater(backend.generations(['categories'])[0], 0)
+
+
+    def test_failing_response_cache_serves_misses(self):
+        class LockedBackend(MemoryCacheBackend):
+            def get(self, key):
+                raise sqlite3.OperationalError('database is locked')
+
+            def bump(self, table):
+                raise sqlite3.OperationalError('database is locked')
+
+        app = create_app(harness_config())
+        cache = ResponseCache(LockedBackend())
+        cache.init_app(app)
+        app.add_url_rule('/cached', 'cached', cache.cached('questions')(lambda: jsonify({'success': True})))
+
+        with self.assertLogs(app.logger, 'WARNING'):
+            res = app.test_client().get('/cached')
+            Question(question='Locked?', answer='No', category=1, difficulty=1).insert()
+        self.assertEqual(res.status_code, 200)
+
+
+    def test_sqlite_response_cache_hit_skips_recent_touch(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        backend = SQLiteCacheBackend(os.path.join(folder, 'cache.db'))
+        backend.set('a', 0, b'page', 'application/json')
+
+        statements = []
+        backend._connection().set_trace_callback(statements.append)
+        self.assertEqual(backend.get('a')[1], b'page')
+        self.assertEqual([statement for statement in statements if statement.startswith('UPDATE')], [])
+
+
+    def test_room_broadcasts_questions_and_scores(self):
+        room = json.loads(self.client().post("/api/rooms", json={"quiz_category": {"id": 1}}).data)
+        res = self.client().get(f"/api/rooms/{room['room_id']}/events", buffered=False)
+        self.assertEqual(res.mimetype, "text/event-stream")
+        events = iter(res.response)
+        self.assertTrue(next(events).startswith(b"event: state\n"))
+
+        self.client().post(f"/api/rooms/{room['room_id']}/players", json={"player_name": "Ada"})
+        self.assertEqual(next(events), b'event: score\ndata: {"player_name":"Ada","score":0}\n\n')
+
+        res = self.client().post(f"/api/rooms/{room['room_id']}/next", json={"host_token": "guess"})
+        self.assertEqual(res.status_code, 403)
+        question = json.loads(self.client().post(f"/api/rooms/{room['room_id']}/next",
+                                                 json={"host_token": room["host_token"]}).data)["question"]
+        self.assertNotIn("answer", question)
+        event = next(events).decode()
+        self.assertTrue(event.startswith("event: question\n"))
+        self.assertEqual(json.loads(event.split("data: ")[1])["id"], question["id"])
+
+        answer = {"player_name": "Ada", "answer": Question.query.get(question["id"]).answer.upper()}
+        data = json.loads(self.client().post(f"/api/rooms/{room['room_id']}/answers", json=answer).data)
+        self.assertEqual(data["correct"], True)
+        self.assertEqual(next(events), b'event: score\ndata: {"player_name":"Ada","score":1}\n\n')
+        res = self.client().post(f"/api/rooms/{room['room_id']}/answers", json=answer)
+        self.assertEqual(res.status_code, 422)
+
+        while "question" in json.loads(self.client().post(f"/api/rooms/{room['room_id']}/next",
+                                                          json={"host_token": room["host_token"]}).data):
+            self.assertTrue(next(events).startswith(b"event: question\n"))
+        self.assertEqual(next(events), b'event: end\ndata: {"scores":{"Ada":1}}\n\n')
+        self.assertEqual(list(events), [])
+        self.assertEqual(Player.query.filter_by(name="Ada").first().score, 1)
+
+
+    def test_room_answer_to_question_without_answer(self):
+        category = Category(type='Unanswered')
+        category.insert()
+        Question(question='What has no answer?', answer=None, category=category.id, difficulty=1).insert()
+        room = json.loads(self.client().post("/api/rooms", json={"quiz_category": {"id": category.id}}).data)
+        self.client().post(f"/api/rooms/{room['room_id']}/players", json={"player_name": "Ada"})
+        self.client().post(f"/api/rooms/{room['room_id']}/next", json={"host_token": room["host_token"]})
+
+        res = self.client().post(f"/api/rooms/{room['room_id']}/answers", json={"player_name": "Ada", "answer": "Nothing"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)["correct"], False)
+
+
+    def test_room_drops_slow_subscribers(self):
+        room = Room([1, 2, 3], "host")
+        slow, fast = Subscriber(size=2), Subscriber(size=2)
+        room.subscribers.update((slow, fast))
+
+        for number in range(3):
+            room.publish("score", {"score": number})
+            self.assertEqual(fast.pull(0), sse_message("score", {"score": number}))
+
+        self.assertEqual(room.subscribers, {fast})
+        self.assertIsNone(slow.pull(0))
+
+
+    def test_404_room_does_not_exist(self):
+        with self.sql_budget(statements=0):
+            res = self.client().post("/api/rooms/not-a-room/players", json={"player_name": "Ada"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "quiz room not found")
+
+
+    def test_422_room_answer_invalid_player_name(self):
+        room = json.loads(self.client().post("/api/rooms", json={"quiz_category": {"id": 1}}).data)
+        self.client().post(f"/api/rooms/{room['room_id']}/next", json={"host_token": room["host_token"]})
+
+        res = self.client().post(f"/api/rooms/{room['room_id']}/answers", json={"player_name": ["x"], "answer": "y"})
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(json.loads(res.data)["success"], False)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -13,6 +13,7 @@ class QuestionView extends Component {
       totalQuestions: 0,
       categories: {},
       currentCategory: null,
+      currentCategoryId: 0,
     };
   }
 
@@ -30,6 +31,7 @@ class QuestionView extends Component {
           totalQuestions: result.total_questions,
           categories: result.categories,
           currentCategory: result.current_category,
+          currentCategoryId: 0,
         });
         return;
       },
@@ -72,6 +74,7 @@ class QuestionView extends Component {
           questions: result.questions,
           totalQuestions: result.total_questions,
           currentCategory: result.current_category,
+          currentCategoryId: id,
         });
         return;
       },
@@ -88,7 +91,10 @@ class QuestionView extends Component {
       type: 'POST',
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({ searchTerm: searchTerm }),
+      data: JSON.stringify({
+        searchTerm: searchTerm,
+        category: this.state.currentCategoryId,
+      }),
       xhrFields: {
         withCredentials: true,
       },